@@ -0,0 +1,90 @@
+"""Accuracy vs. speed report of the Barnes-Hut gravity backend against the exact pairwise sum.
+
+Run from the repository root:
+    python benchmarks/barnes_hut_accuracy.py --bodies 100 1000 5000 --theta 0.3 0.5 0.7 1.0
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "orbit-sim"))
+
+from orbit_simulation.barnes_hut import barnes_hut_accelerations  # noqa: E402
+from orbit_simulation.gravity import direct_accelerations  # noqa: E402
+from settings import OrbitSettings  # noqa: E402
+
+
+def make_scene(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """A sun in the origin with n - 1 planets scattered in a disk around it."""
+    radius = rng.uniform(50.0, 600.0, n)
+    angle = rng.uniform(0.0, 2 * np.pi, n)
+    positions = np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=1)
+    masses = rng.uniform(1.0, 500.0, n)
+
+    positions[0] = 0.0
+    masses[0] = OrbitSettings.SUN_MASS
+    return positions, masses
+
+
+def best_time(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bodies", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--theta", type=float, nargs="+", default=[0.3, 0.5, 0.7, 1.0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    rows = []
+
+    print(f"{'bodies':>7} {'theta':>6} {'mean err':>10} {'p95 err':>10} {'max err':>10} {'direct [ms]':>12} {'BH [ms]':>10} {'speedup':>8}")
+    for n in args.bodies:
+        positions, masses = make_scene(n, rng)
+
+        exact = direct_accelerations(positions, masses)
+        t_direct = best_time(lambda: direct_accelerations(positions, masses), args.repeat)
+        exact_norm = np.linalg.norm(exact, axis=1)
+
+        for theta in args.theta:
+            approx = barnes_hut_accelerations(positions, masses, theta=theta)
+            t_bh = best_time(lambda: barnes_hut_accelerations(positions, masses, theta=theta), args.repeat)
+
+            # Relative error of the acceleration vector of each body
+            error = np.linalg.norm(approx - exact, axis=1) / exact_norm
+            row = dict(
+                bodies=n,
+                theta=theta,
+                mean_error=float(error.mean()),
+                p95_error=float(np.percentile(error, 95)),
+                max_error=float(error.max()),
+                direct_seconds=t_direct,
+                barnes_hut_seconds=t_bh,
+                speedup=t_direct / t_bh,
+            )
+            rows.append(row)
+            print(
+                f"{n:>7} {theta:>6.2f} {row['mean_error']:>10.2e} {row['p95_error']:>10.2e} {row['max_error']:>10.2e} "
+                f"{1e3 * t_direct:>12.2f} {1e3 * t_bh:>10.2f} {row['speedup']:>8.2f}"
+            )
+
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=2))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Benchmarks of the simulation hot paths across body counts.
+
+Each case is timed for every body count and the results are written as JSON.
+When a baseline exists, every timing is compared against it and the run fails on regressions.
+
+Run from the repository root:
+    python benchmarks/bench.py                                   # compare against benchmarks/baseline.json
+    python benchmarks/bench.py --bodies 2 10 100 --cases predict
+    python benchmarks/bench.py --save-baseline                   # store the current timings as the baseline
+    python benchmarks/bench.py --cases predict --save-baseline   # re-record only the timings of one case
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "orbit-sim"))
+
+from orbit_simulation import OrbitSimulator  # noqa: E402
+from orbit_simulation.celestial_body import CelestialBody  # noqa: E402
+from settings import AppSettings, OrbitSettings  # noqa: E402
+
+BENCHMARKS = Path(__file__).resolve().parent
+BASELINE = BENCHMARKS / "baseline.json"
+
+
+def make_simulator(n: int, seed: int = 0) -> OrbitSimulator:
+    """A sun with n - 1 planets on circular orbits that stay on screen and clear of the sun."""
+    rng = np.random.default_rng(seed)
+    bodies = [CelestialBody.make_sun()]
+
+    for _ in range(n - 1):
+        radius = rng.uniform(80.0, 280.0)
+        angle = rng.uniform(0.0, 2 * np.pi)
+        speed = np.sqrt(OrbitSettings.G * OrbitSettings.SUN_MASS / radius)
+        position = radius * np.array([np.cos(angle), np.sin(angle)])
+        velocity = speed * np.array([-np.sin(angle), np.cos(angle)])
+        bodies.append(CelestialBody(position, velocity, mass=rng.uniform(1.0, 10.0)))
+
+    return OrbitSimulator(destr_callback=lambda *args: None, bodies=bodies)
+
+
+def bench_physics_step(n: int, n_body_sim: bool):
+    orbit_simulator = make_simulator(n)
+
+    def step():
+        orbit_simulator.physics_step(1 / 60.0, orbit_simulator.store, n_body_sim=n_body_sim)
+
+        # Advance the clock like OrbitSimulator.step, so the history is sampled at its usual rate
+        orbit_simulator.time += 1 / 60.0
+
+    return step
+
+
+def bench_block_step(n: int):
+    orbit_simulator = make_simulator(n)
+    return lambda: orbit_simulator.block_timesteps.step(orbit_simulator.store, 1 / 60.0)
+
+
+def bench_predict(n: int, aim_fan: bool):
+    """A launch in the field of the cached ephemeris: its trajectory alone, or batched with the aim fan as predict does."""
+    orbit_simulator = make_simulator(n)
+    ephemeris, masses = orbit_simulator.get_ephemeris(), orbit_simulator.store.masses
+    if aim_fan:
+        return lambda: orbit_simulator.predict(position=(300.0, 0.0), velocity=(0.0, 200.0))
+
+    return lambda: orbit_simulator.integrate_test_body((300.0, 0.0), (0.0, 200.0), ephemeris, masses)
+
+
+def bench_ephemeris(n: int):
+    """The future of the bodies, computed once per store version before the first prediction."""
+    orbit_simulator = make_simulator(n)
+    store = orbit_simulator.store
+    return lambda: orbit_simulator.compute_ephemeris(store.positions, store.velocities, store.masses)
+
+
+def bench_destruction_check(n: int):
+    orbit_simulator = make_simulator(n)
+    screen_size = np.array([AppSettings.WIDTH_INIT, AppSettings.HEIGHT_INIT])
+    return lambda: orbit_simulator.destruction_check(screen_size)
+
+
+def bench_collision_check(n: int):
+    orbit_simulator = make_simulator(n)
+    return orbit_simulator.collision_check
+
+
+def bench_generate_particles(n: int):
+    from vfx.particle_bursts import generate_particles
+
+    rng = np.random.default_rng(0)
+    return lambda: generate_particles((10.0, 20.0), (100.0, 50.0), (255, 128, 0), n, rng)
+
+
+def bench_particles_cpu_step(n: int):
+    from vfx.cpu_particles import CPUParticleBurstHandler
+
+    orbit_simulator = make_simulator(n)
+    particles = CPUParticleBurstHandler()
+    particles.create_burst((300.0, 0.0), (0.0, 200.0), (255, 128, 0))
+    particles.set_uniforms(1 / 60.0, orbit_simulator.store)
+    return particles.step
+
+
+CASES = {
+    "physics_step[n_body]": lambda n: bench_physics_step(n, n_body_sim=True),
+    "physics_step[sun_only]": lambda n: bench_physics_step(n, n_body_sim=False),
+    "block_step[n_body]": bench_block_step,
+    "predict": lambda n: bench_predict(n, aim_fan=False),
+    "predict[aim_fan]": lambda n: bench_predict(n, aim_fan=True),
+    "ephemeris": bench_ephemeris,
+    "destruction_check": bench_destruction_check,
+    "collision_check": bench_collision_check,
+    "generate_particles": bench_generate_particles,
+    "particles_cpu_step": bench_particles_cpu_step,
+}
+
+
+def measure(func, min_time: float, max_repeat: int) -> dict:
+    """Call func until min_time has passed (at least once, at most max_repeat times)."""
+    timings = []
+    total_start = time.perf_counter()
+    while len(timings) < max_repeat and (not timings or time.perf_counter() - total_start < min_time):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return dict(median=statistics.median(timings), min=min(timings), repeats=len(timings))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> tuple[list[str], list[str]]:
+    """Print the ratio of each median to the baseline and return the regressed entries and the entries without a baseline."""
+    regressions, missing = [], []
+    print(f"\n{'case':<26} {'bodies':>7} {'baseline [ms]':>14} {'current [ms]':>13} {'ratio':>7}")
+
+    for case, timings in results.items():
+        for n, timing in timings.items():
+            reference = baseline.get(case, {}).get(n)
+            if reference is None:
+                missing.append(f"{case}/{n}")
+                print(f"{case:<26} {n:>7} {'-':>14} {1e3 * timing['median']:>13.3f} {'-':>7}  NO BASELINE")
+                continue
+
+            ratio = timing["median"] / reference["median"]
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  REGRESSION"
+                regressions.append(f"{case}/{n}")
+
+            print(f"{case:<26} {n:>7} {1e3 * reference['median']:>14.3f} {1e3 * timing['median']:>13.3f} {ratio:>7.2f}{flag}")
+
+    return regressions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--bodies", type=int, nargs="+", default=[2, 10, 100, 1000, 10000])
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum measuring time per case and body count [s].")
+    parser.add_argument("--max-repeat", type=int, default=200)
+    parser.add_argument("--output", type=Path, default=BENCHMARKS / "results.json")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown against the baseline.")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file as well.")
+    args = parser.parse_args()
+
+    results = {}
+    for case in args.cases:
+        results[case] = {}
+        for n in args.bodies:
+            timing = measure(CASES[case](n), args.min_time, args.max_repeat)
+            results[case][str(n)] = timing
+            print(f"{case:<26} {n:>7} bodies: {1e3 * timing['median']:>10.3f} ms (median of {timing['repeats']})")
+
+    report = dict(
+        meta=dict(
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            processor=platform.processor(),
+        ),
+        results=results,
+    )
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    # The timings of the measured cases and body counts replace theirs in the baseline, the others are kept
+    if args.save_baseline:
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text())
+            for case, timings in results.items():
+                baseline["results"].setdefault(case, {}).update(timings)
+            report["results"] = baseline["results"]
+
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, skipping the comparison.")
+        return
+
+    regressions, missing = compare(results, json.loads(args.baseline.read_text())["results"], args.tolerance)
+    if missing:
+        print(f"\n{len(missing)} timing(s) without a baseline, record them with --save-baseline: {', '.join(missing)}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,52 @@
-import arcade
-from game import OrbitSimulatorWindow
+import argparse
+from pathlib import Path
+from settings import AppSettings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="orbit-sim", description="N-body gravity simulation to play with planet orbits.")
+    parser.add_argument("--headless", action="store_true", help="Run the simulation without a window.")
+    parser.add_argument("--steps", type=int, default=1000, help="Number of physics steps in headless mode.")
+    parser.add_argument("--dt", type=float, default=1 / 60.0, help="Time step of the physics in headless mode.")
+    parser.add_argument("--scenario", type=Path, help="JSON scenario file with the initial bodies.")
+    parser.add_argument("--output", type=Path, help="Write the final state as a JSON scenario file in headless mode.")
+    parser.add_argument("--snapshot", type=Path, help="Start from a binary snapshot file (see F5 in the game).")
+    parser.add_argument("--save-snapshot", type=Path, help="Write the final state as a binary snapshot file in headless mode.")
+    parser.add_argument("--replay", type=Path, help="Play back a recording directory in the game (see --record).")
+    parser.add_argument("--record", type=Path, help="Record every step into a recording directory in headless mode.")
+    parser.add_argument("--ensemble", type=int, metavar="RUNS", help="Run an ensemble of random launches in headless mode.")
+    parser.add_argument("--workers", type=int, help="Processes of an ensemble run (default: one per core).")
+    parser.add_argument("--seed", type=int, help="Random seed of the ensemble launches.")
+    parser.add_argument(
+        "--screen-size", type=int, nargs=2, default=(AppSettings.WIDTH_INIT, AppSettings.HEIGHT_INIT), metavar=("WIDTH", "HEIGHT"),
+        help="Screen size used for the escape check in headless mode."
+    )
+    return parser.parse_args()
 
 
 def main():
-    OrbitSimulatorWindow()
+    args = parse_args()
+
+    if args.headless and args.ensemble:
+        from headless import run_headless_ensemble
+        run_headless_ensemble(
+            args.ensemble, steps=args.steps, dt=args.dt, screen_size=args.screen_size, scenario=args.scenario,
+            workers=args.workers, seed=args.seed,
+        )
+        return
+
+    if args.headless:
+        from headless import run_headless
+        run_headless(
+            steps=args.steps, dt=args.dt, screen_size=args.screen_size, scenario=args.scenario, output=args.output,
+            snapshot=args.snapshot, save_snapshot=args.save_snapshot, record=args.record,
+        )
+        return
+
+    import arcade
+    from game import OrbitSimulatorWindow
+
+    OrbitSimulatorWindow(snapshot=args.snapshot, replay=args.replay)
     arcade.run()
 
 
@@ -1,25 +1,42 @@
 import arcade
 import numpy as np
-from gui import generate_instructions, FPSCounter, PlanetCounter, ParticleCounter
+from gui import generate_instructions, FPSCounter, PlanetCounter, ParticleCounter, TimeWarpCounter, CullCounter, FrameTimeTable, TimelineScrubber
 from utils import Vector, normalize
 from orbit_simulation import OrbitSimulator
+from orbit_simulation.orbit_simulator import ESCAPED
+from orbit_simulation.scheduler import FixedStepScheduler
+from orbit_simulation.snapshot import SnapshotError, read_snapshot, write_snapshot
+from orbit_simulation.recorder import Recording
+from orbit_simulation.replay import ReplayPlayer
+from profiling import PROFILER
+from datetime import datetime
+from pathlib import Path
+from pyglet.math import Vec2
 from typing import Optional, Tuple
 from settings import AppSettings, Color, OrbitSettings
 from gui.game_window import GameWindow, shift_mouse_position
-from vfx import ParticleBurstHandler
+from vfx import BodyRenderer, TrailRenderer, create_particle_handler
 
 
 class OrbitSimulatorWindow(GameWindow):
     """Handles the Game Logic, UX and game object draw calls"""
 
-    def __init__(self):
+    def __init__(self, snapshot: Optional[Path] = None, replay: Optional[Path] = None):
         super().__init__()
 
         # Simulator instance
         self.orbit_simulator = OrbitSimulator(destr_callback=self.on_planet_destruction)
 
+        # Fixed timestep: simulated time of the latest frame, also used to move the particles
+        self.scheduler = FixedStepScheduler()
+        self.frame_sim_time = 0.0
+
         # Particle bursts
-        self.particles = ParticleBurstHandler(ctx=self.ctx)
+        self.particles = create_particle_handler(ctx=self.ctx)
+
+        # Histories and predictions
+        self.trails = TrailRenderer(ctx=self.ctx)
+        self.body_renderer = BodyRenderer()
 
         # Store mouse status information for "drag and drop"
         self.mousePress: Optional[Vector] = None
@@ -37,23 +54,101 @@ class OrbitSimulatorWindow(GameWindow):
         self.fps = FPSCounter(*AppSettings.FPS_LOCATION)
         self.planet_counter = PlanetCounter(*AppSettings.PLANET_COUNT_LOCATION)
         self.particle_counter = ParticleCounter(*AppSettings.PARTICLE_COUNT_LOCATION)
+        self.time_warp_counter = TimeWarpCounter(*AppSettings.TIME_WARP_LOCATION)
+        self.cull_counter = CullCounter(*AppSettings.CULL_COUNT_LOCATION)
+        self.frame_times = FrameTimeTable(*AppSettings.FRAME_TIMES_LOCATION, y_sep=AppSettings.FRAME_TIMES_Y_SEP)
+
+        if snapshot is not None:
+            self.load_snapshot(snapshot)
+
+        # Replay mode: a recording is played back instead of running the physics
+        self.replay: Optional[ReplayPlayer] = None
+        self.timeline = TimelineScrubber()
+        self.timeline.resize(self.width)
+        if replay is not None:
+            self.start_replay(replay)
+
+    def on_planet_destruction(self, events: list[tuple], kind: str):
+        """Callback when planets are destroyed: a burst for each (pos, vel, col) event.
+        Escaped bodies are far off screen, they leave without a burst.
+        """
+        if kind == ESCAPED:
+            return
+
+        self.particles.create_bursts(events)
+        self.n_particles += len(events)
 
-    def on_planet_destruction(self, pos, vel, col):
-        """Callback when a planet is destroyed."""
-        self.particles.create_burst(pos, vel, col)
-        self.n_particles += 1
+    def save_snapshot(self, path: Path):
+        """Write the bodies, histories, camera position and (optionally) the particles into a snapshot file."""
+        snapshot = self.orbit_simulator.snapshot()
+        snapshot.meta["camera"] = list(self.main_camera.position)
+
+        if AppSettings.SNAPSHOT_PARTICLES:
+            snapshot.arrays.update({f"particles/{name}": array for name, array in self.particles.state().items()})
+
+        write_snapshot(path, snapshot)
+        print(f"Snapshot saved to {path}")
+
+    def load_snapshot(self, path: Path):
+        try:
+            snapshot = read_snapshot(path)
+        except (OSError, SnapshotError) as error:
+            print(f"Cannot load snapshot: {error}")
+            return
 
-    def on_resize(self, *args, **kwargs):
-        super().on_resize(*args, **kwargs)
+        self.orbit_simulator.restore(snapshot)
+        if "camera" in snapshot.meta:
+            self.main_camera.move_to(Vec2(*snapshot.meta["camera"]), speed=1.0)
+
+        if "particles/data" in snapshot:
+            self.particles.restore(dict(data=snapshot["particles/data"], bursts=snapshot["particles/bursts"]))
+        print(f"Snapshot loaded from {path}")
+
+    def start_replay(self, path: Path):
+        self.replay = ReplayPlayer(Recording(path))
+        self.orbit_simulator.store = self.replay.store
+        self.orbit_simulator.clear_futures()
+        print(f"Replaying {path}: {len(self.replay.recording)} steps, {self.replay.duration:.1f} s")
+
+    def toggle_recording(self):
+        if self.orbit_simulator.recorder is None:
+            path = AppSettings.RECORDINGS_DIR / datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.orbit_simulator.start_recording(path)
+            print(f"R: Recording to {path}")
+        else:
+            print(f"R: Recording stopped after {self.orbit_simulator.recorder.total_steps} steps")
+            self.orbit_simulator.stop_recording()
+
+    def export_frame_times(self, path: Path):
+        PROFILER.export(path)
+        print(f"T: Frame times of the last {len(PROFILER.frames())} frames written to {path}")
+
+    def close(self):
+        """Finish the recording and the predictions before the window closes (window button, ESC or Q)."""
+        self.orbit_simulator.close()
+        super().close()
+
+    def on_resize(self, width: float, height: float):
+        super().on_resize(width, height)
+        self.timeline.resize(int(width))
         self.orbit_simulator.clear_histories()
 
     def on_update(self, delta_time: float):
         """This method runs the physics and motion of each body."""
 
+        if self.replay is not None:
+            self.replay.speed = self.scheduler.warp
+            with PROFILER.span("replay"):
+                self.replay.advance(delta_time)
+            return
+
         if self.paused:
+            self.frame_sim_time = 0.0
             return
 
-        self.orbit_simulator.step(dt=delta_time, screen_size=self.screen_size)
+        self.frame_sim_time = self.scheduler.advance(
+            delta_time, lambda dt: self.orbit_simulator.step(dt=dt, screen_size=self.screen_size)
+        )
 
     def draw_drag_ang_shoot_line(self):
         # Draw UI line when dragging
@@ -69,35 +164,65 @@ class OrbitSimulatorWindow(GameWindow):
         # Clear screen
         self.clear()
 
+        # Only what overlaps the view of the main camera is drawn
+        view = self.view_rect
+
         # Draw histories:
-        self.orbit_simulator.draw_histories()
+        with PROFILER.span("draw_histories"):
+            self.trails.draw_histories(self.orbit_simulator.store, view)
 
         # Draw futures:
         if self.paused:
-            self.orbit_simulator.draw_futures()
+            with PROFILER.span("draw_futures"):
+                self.trails.draw_futures(self.orbit_simulator.prediction, view)
 
-        # Draw particles:
-        self.particles.set_uniforms(dt=1/60.0, bodies=self.orbit_simulator.bodies)
-        self.particles.draw(self.paused)
+        # Draw particles: the time to dispatch the particle step and draw call, the GPU runs them asynchronously
+        with PROFILER.span("particles"):
+            self.particles.set_uniforms(dt=self.frame_sim_time, store=self.orbit_simulator.store)
+            self.particles.draw(self.paused, view)
 
         # Draw Bodies:
-        self.orbit_simulator.draw_bodies()
+        with PROFILER.span("draw_bodies"):
+            self.body_renderer.draw(self.orbit_simulator.store, view)
 
         # Draw line when dragging
         self.draw_drag_ang_shoot_line()
 
         # GUI widgets are drawn by the base class:
-        super().on_draw()
+        with PROFILER.span("draw_gui"):
+            super().on_draw()
+
+            self.fps.update_and_draw()
+            self.planet_counter.update_and_draw(orbit_simulator=self.orbit_simulator)
+            self.particle_counter.update_and_draw(self.particles)
+            self.time_warp_counter.update_and_draw(self.scheduler)
+            self.cull_counter.update_and_draw(
+                self.body_renderer.culled, self.trails.culled_histories + self.trails.culled_futures, self.particles.culled
+            )
+
+            if self.replay is not None:
+                self.timeline.draw(self.replay)
 
-        self.fps.update_and_draw()
-        self.planet_counter.update_and_draw(orbit_simulator=self.orbit_simulator)
-        self.particle_counter.update_and_draw(self.particles)
+        if AppSettings.SHOW_FRAME_TIMES:
+            self.frame_times.update_and_draw(PROFILER)
+
+        # Frames end after drawing: the spans of this frame's update and draw are stored together
+        PROFILER.end_frame()
 
     def on_key_release(self, symbol: int, modifiers: int):
         """Handle game logic keybinds"""
         super().on_key_release(symbol, modifiers)
 
         match (symbol, modifiers):
+            case (arcade.key.P, _) if self.replay is not None:
+                if not self.replay.playing and self.replay.time >= self.replay.recording.end_time:
+                    self.replay.seek(self.replay.recording.start_time)
+                self.replay.playing = not self.replay.playing
+
+            # The replay owns the bodies: deleting, recording and snapshots would act on a store that is not simulated
+            case (arcade.key.D | arcade.key.R | arcade.key.F5 | arcade.key.F9, _) if self.replay is not None:
+                print("Not available during a replay")
+
             case (arcade.key.P, _):
                 self.paused = not self.paused
                 print("P: Game paused") if self.paused else print("P: Game unpaused")
@@ -110,6 +235,26 @@ class OrbitSimulatorWindow(GameWindow):
                 print("C: clearing all particles")
                 self.particles.clear_all()
 
+            case (arcade.key.R, _):
+                self.toggle_recording()
+
+            case (arcade.key.T, _):
+                self.export_frame_times(AppSettings.PROFILE_FILE)
+
+            case (arcade.key.F5, _):
+                self.save_snapshot(AppSettings.SNAPSHOT_FILE)
+
+            case (arcade.key.F9, _):
+                self.load_snapshot(AppSettings.SNAPSHOT_FILE)
+
+            case (arcade.key.RIGHT, _):
+                self.scheduler.set_warp(2 * self.scheduler.warp)
+                print(f"Time warp: {self.scheduler.warp:g}x")
+
+            case (arcade.key.LEFT, _):
+                self.scheduler.set_warp(self.scheduler.warp / 2)
+                print(f"Time warp: {self.scheduler.warp:g}x")
+
             case (arcade.key.UP, _):
                 self.massToPlace += 50.0
                 print(f"Mass increased: {self.massToPlace:.2f}")
@@ -145,9 +290,23 @@ class OrbitSimulatorWindow(GameWindow):
 
         return pos, vel
 
+    def seek_replay(self, x: float, y: float) -> bool:
+        """Seek the replay when the screen space coordinate is on the timeline. Returns whether it was."""
+        progress = self.timeline.progress_at(*self.screen2window(x, y))
+        if progress is None:
+            return False
+
+        self.replay.seek_progress(progress)
+        return True
+
     @shift_mouse_position
     def on_mouse_press(self, x: float, y: float, button: int, modifiers: int):
         """Called whenever a mouse button is pressed."""
+        if self.replay is not None:
+            if button == 1:
+                self.seek_replay(x, y)
+            return
+
         match (button, modifiers):
             
             # LMB Press
@@ -163,6 +322,9 @@ class OrbitSimulatorWindow(GameWindow):
     @shift_mouse_position
     def on_mouse_release(self, x: float, y: float, button: int, modifiers: int):
         """Called whenever a mouse button is released."""
+        if self.replay is not None:
+            return
+
         match (button, modifiers):
             
             # LMB Release
@@ -200,6 +362,11 @@ class OrbitSimulatorWindow(GameWindow):
     ):
         super().on_mouse_drag(x, y, dx, dy, buttons, modifiers)
 
+        if self.replay is not None:
+            if buttons == 1:
+                self.seek_replay(x, y)
+            return
+
         match (buttons, modifiers):
             
             # LMB or MMB drag
@@ -208,13 +375,6 @@ class OrbitSimulatorWindow(GameWindow):
                 # Update the mouse to the last position
                 self.latestMousePosition = np.array([x, y])
 
-                # Ignore fast movements
-                if (
-                    abs(dx) > AppSettings.DRAG_MOUSE_DELTA
-                    or abs(dy) >= AppSettings.DRAG_MOUSE_DELTA
-                ):
-                    return
-
-                # Dispatch a future prediction step
+                # Dispatch a future prediction to the background worker, it replaces any older request
                 if result := self.get_drag_release_info(mousePress=self.mousePress, mouseRelease=self.latestMousePosition):
-                    self.orbit_simulator.predict(*result)
+                    self.orbit_simulator.predict_async(*result)
@@ -1,4 +1,4 @@
 from .game_window import GameWindow
 from .instructions import generate_instructions
-from .updatable_text import FPSCounter, PlanetCounter, ParticleCounter
-
+from .updatable_text import FPSCounter, PlanetCounter, ParticleCounter, TimeWarpCounter, CullCounter, FrameTimeTable
+from .timeline import TimelineScrubber
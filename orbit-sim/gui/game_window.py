@@ -30,14 +30,19 @@ class GameWindow(arcade.Window):
     """
 
     def __init__(self):
-        super().__init__(
+        window_args = (
             AppSettings.WIDTH_INIT,
             AppSettings.HEIGHT_INIT,
             AppSettings.TITLE,
             AppSettings.FULLSCREEN,
             AppSettings.RESIZABLE,
-            gl_version=(4, 3)
         )
+        try:
+            super().__init__(*window_args, gl_version=AppSettings.GL_VERSION)
+        except (pyglet.window.NoSuchConfigException, pyglet.gl.ContextException):
+            # No OpenGL 4.3 (e.g. macOS): open a window without compute shader support
+            print(f"OpenGL {AppSettings.GL_VERSION} is not available, falling back to {AppSettings.GL_VERSION_FALLBACK}")
+            super().__init__(*window_args, gl_version=AppSettings.GL_VERSION_FALLBACK)
         arcade.set_background_color(Color.BACKGROUND_COLOR)
 
         # Set custom icon
@@ -99,6 +104,12 @@ class GameWindow(arcade.Window):
         y -= self.main_camera.viewport_height / 2
         self.main_camera.move_to(Vec2(x, y), speed=speed)
 
+    @property
+    def view_rect(self) -> Tuple[float, float, float, float]:
+        """The part of screen space (game space) in view of the main camera: (left, bottom, right, top)."""
+        x, y = self.main_camera.position
+        return x, y, x + self.main_camera.viewport_width, y + self.main_camera.viewport_height
+
     def window2screen(self, x, y):
         """ Convert window space coordinate to screen space. (game space) """
         dx, dy = self.main_camera.position
@@ -0,0 +1,40 @@
+import arcade
+from typing import Optional
+from orbit_simulation.replay import ReplayPlayer
+from settings import AppSettings, Color
+
+
+class TimelineScrubber:
+    """Timeline bar of a replay: shows the playhead, clicking or dragging on it seeks."""
+
+    def __init__(self, font_size: int = 11):
+        self.left = AppSettings.TIMELINE_MARGIN
+        self.bottom = AppSettings.TIMELINE_Y
+        self.width = 0
+        self.text = arcade.Text("", self.left, self.bottom + 2 * AppSettings.TIMELINE_HEIGHT, arcade.color.WHITE, font_size)
+
+    def resize(self, width: int):
+        self.width = width - 2 * AppSettings.TIMELINE_MARGIN
+
+    def progress_at(self, x: float, y: float) -> Optional[float]:
+        """Timeline position [0, 1] under the window coordinate (x, y), None when it is not on the bar."""
+        if not (self.bottom - AppSettings.TIMELINE_HEIGHT <= y <= self.bottom + 2 * AppSettings.TIMELINE_HEIGHT):
+            return None
+        if not (self.left <= x <= self.left + self.width):
+            return None
+
+        return (x - self.left) / self.width
+
+    def draw(self, replay: ReplayPlayer):
+        top = self.bottom + AppSettings.TIMELINE_HEIGHT
+        arcade.draw_lrtb_rectangle_filled(self.left, self.left + self.width, top, self.bottom, Color.TIMELINE_COLOR)
+        arcade.draw_lrtb_rectangle_filled(
+            self.left, self.left + self.width * replay.progress, top, self.bottom, Color.TIMELINE_PROGRESS_COLOR
+        )
+
+        state = "playing" if replay.playing else "paused"
+        self.text.value = (
+            f"Replay {replay.time - replay.recording.start_time:0.1f} / {replay.duration:0.1f} s "
+            f"({state}, {replay.speed:g}x)  P: play / pause, LEFT / RIGHT: speed, click the bar to seek"
+        )
+        self.text.draw()
@@ -1,8 +1,10 @@
 import time
 import arcade
 from collections import deque
-from vfx.particle_bursts import ParticleBurstHandler
+from vfx.particle_bursts import ParticleArena
 from orbit_simulation import OrbitSimulator
+from orbit_simulation.scheduler import FixedStepScheduler
+from profiling import FrameProfiler
 
 
 class UpdatableText:
@@ -30,11 +32,29 @@ class ParticleCounter(UpdatableText):
     def __init__(self, x, y, **kwargs):
         super().__init__(x, y, fix_text="Nr of particles", **kwargs)
 
-    def update_and_draw(self, particle_handler: ParticleBurstHandler):
+    def update_and_draw(self, particle_handler: ParticleArena):
         self.update_text(value=particle_handler.get_nr_particles())
         super().draw()
 
 
+class TimeWarpCounter(UpdatableText):
+    def __init__(self, x, y, **kwargs):
+        super().__init__(x, y, fix_text="Time warp", **kwargs)
+
+    def update_and_draw(self, scheduler: FixedStepScheduler):
+        self.update_text(value=f"{scheduler.warp:g}x ({scheduler.frame_steps} steps/frame, {scheduler.dropped_steps} dropped)")
+        super().draw()
+
+
+class CullCounter(UpdatableText):
+    def __init__(self, x, y, **kwargs):
+        super().__init__(x, y, fix_text="Culled", **kwargs)
+
+    def update_and_draw(self, bodies: int, trails: int, particles: int):
+        self.update_text(value=f"{bodies} bodies, {trails} trails, {particles} particles")
+        super().draw()
+
+
 class FPSCounter(UpdatableText):
     def __init__(self, x, y, average_of: int = 30, **kwargs):
         super().__init__(x, y, fix_text="FPS", **kwargs)
@@ -50,3 +70,25 @@ class FPSCounter(UpdatableText):
         self.frame_times.append(time.time())
         if len(self.frame_times) > 1:
             self.fps = len(self.frame_times) / (self.frame_times[-1] - self.frame_times[0])
+
+
+class FrameTimeTable:
+    """Mean, 95th percentile and maximum time of each profiled span, one line per span."""
+
+    def __init__(self, x, y, y_sep: int = 16, font_size: int = 10, color=arcade.color.WHITE):
+        self.x, self.y, self.y_sep = x, y, y_sep
+        self.font_size = font_size
+        self.color = color
+        self.title = arcade.Text(f"{'[ms]':<18}{'mean':>7}{'p95':>7}{'max':>7}", x, y, color, font_size, font_name="Courier New", bold=True)
+        self.lines: list[arcade.Text] = []
+
+    def update_and_draw(self, profiler: FrameProfiler):
+        stats = profiler.stats()
+        while len(self.lines) < len(stats):
+            y = self.y - (len(self.lines) + 1) * self.y_sep
+            self.lines.append(arcade.Text("", self.x, y, self.color, self.font_size, font_name="Courier New"))
+
+        self.title.draw()
+        for line, (name, (mean, p95, peak)) in zip(self.lines, stats.items()):
+            line.value = f"{name:<18}{1e3 * mean:>7.2f}{1e3 * p95:>7.2f}{1e3 * peak:>7.2f}"
+            line.draw()
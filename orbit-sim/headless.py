@@ -0,0 +1,93 @@
+import time
+from collections import Counter
+import numpy as np
+from pathlib import Path
+from typing import Optional
+from orbit_simulation import OrbitSimulator
+from orbit_simulation.orbit_simulator import ESCAPED, MERGED, SUN_IMPACT
+from orbit_simulation.scenario import load_scenario, save_scenario
+from orbit_simulation.snapshot import read_snapshot, write_snapshot
+from profiling import PROFILER
+from settings import OrbitSettings
+
+
+def run_headless(
+    steps: int, dt: float, screen_size: tuple[int, int], scenario: Optional[Path] = None, output: Optional[Path] = None,
+    snapshot: Optional[Path] = None, save_snapshot: Optional[Path] = None, record: Optional[Path] = None,
+):
+    """Run the simulator without a window: step the physics and check for destruction each step.
+    Reports the throughput and the final state of the bodies.
+    """
+    # Number of destruction events of each kind
+    destroyed = Counter()
+
+    def on_destruction(events, kind):
+        destroyed[kind] += len(events)
+
+    bodies = load_scenario(scenario) if scenario is not None else None
+    orbit_simulator = OrbitSimulator(destr_callback=on_destruction, bodies=bodies)
+    if snapshot is not None:
+        orbit_simulator.restore(read_snapshot(snapshot))
+
+    n_initial = len(orbit_simulator.bodies)
+    screen_size = np.array(screen_size)
+
+    if record is not None:
+        orbit_simulator.start_recording(record)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        orbit_simulator.step(dt=dt, screen_size=screen_size)
+        PROFILER.end_frame()
+    orbit_simulator.stop_recording()
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {steps} steps of dt={dt:g} ({steps * dt:g} s) in {elapsed:.3f} s: {steps / elapsed:.1f} steps/s")
+    print(f"Step times of the last {len(PROFILER.frames())} steps [ms]: " + ", ".join(
+        f"{name} {1e3 * mean:.3f} mean / {1e3 * p95:.3f} p95 / {1e3 * peak:.3f} max" for name, (mean, p95, peak) in PROFILER.stats().items()
+    ))
+    print(
+        f"Bodies: {n_initial} initial, {len(orbit_simulator.bodies)} final, {destroyed[SUN_IMPACT]} destroyed by the sun, "
+        f"{destroyed[ESCAPED]} escaped, {destroyed[MERGED]} merged from collisions"
+    )
+    print(f"{'#':>4} {'x':>12} {'y':>12} {'vx':>12} {'vy':>12} {'mass':>12}")
+    for idx, body in enumerate(orbit_simulator.bodies):
+        print(f"{idx:>4} {body.position[0]:>12.3f} {body.position[1]:>12.3f} {body.velocity[0]:>12.3f} {body.velocity[1]:>12.3f} {body.mass:>12.3g}")
+
+    if output is not None:
+        save_scenario(output, orbit_simulator.bodies)
+        print(f"Final state written to {output}")
+
+    if save_snapshot is not None:
+        write_snapshot(save_snapshot, orbit_simulator.snapshot())
+        print(f"Snapshot written to {save_snapshot}")
+
+    if record is not None:
+        print(f"Recording written to {record}")
+
+    return orbit_simulator
+
+
+def run_headless_ensemble(
+    n: int, steps: int, dt: float, screen_size: tuple[int, int], scenario: Optional[Path] = None,
+    workers: Optional[int] = None, seed: Optional[int] = None,
+):
+    """Launch a body with n random initial conditions into the scenario, one run each, on a pool of processes.
+    Reports how the launched bodies ended up.
+    """
+    from orbit_simulation.ensemble import FATES, launch_sample, run_ensemble
+
+    bodies = load_scenario(scenario) if scenario is not None else None
+    launches = launch_sample(
+        n, radius=OrbitSettings.ENSEMBLE_RADIUS, speed=OrbitSettings.ENSEMBLE_SPEED, angle=OrbitSettings.ENSEMBLE_ANGLE, seed=seed,
+    )
+
+    start = time.perf_counter()
+    ensemble = run_ensemble(launches, steps=steps, dt=dt, screen_size=screen_size, bodies=bodies, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    summary = ensemble.summary()
+    print(f"Simulated {n} runs of {steps} steps in {elapsed:.3f} s: {n / elapsed:.1f} runs/s")
+    print(", ".join(f"{name}: {summary[name]}" for name in FATES) + f", mean survival time {summary['mean_survival_time']:.2f} s")
+
+    return ensemble
@@ -0,0 +1,162 @@
+import numpy as np
+from settings import OrbitSettings
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Interleave zeros between the lower 16 bits of v (used to build 2D Morton keys)."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+
+def _ragged_arange(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + count) for each start and count."""
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+class QuadTree:
+    """Barnes-Hut quadtree over a set of point masses.
+    The bodies are sorted along a Morton (Z-order) curve, so every node covers a contiguous range
+    [start, end) of the sorted bodies and the children of a node are contiguous on the next level.
+    Nodes are stored level by level in flat arrays.
+    """
+
+    def __init__(self, positions: np.ndarray, masses: np.ndarray, max_depth: int = OrbitSettings.BARNES_HUT_MAX_DEPTH):
+        n = len(positions)
+        max_depth = min(max_depth, 16)
+
+        # Bounding square of all bodies
+        lo = positions.min(axis=0)
+        span = float((positions.max(axis=0) - lo).max()) * (1 + 1e-9) or 1.0
+
+        # Morton keys at the deepest level
+        cells = np.minimum(((positions - lo) / span * 2**max_depth).astype(np.int64), 2**max_depth - 1)
+        keys = _spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << np.uint64(1))
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+
+        # Rank of each body along the curve
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[order] = np.arange(n)
+
+        sorted_masses = masses[order]
+        sorted_moments = positions[order] * sorted_masses[:, None]
+
+        starts, ends, sizes, leafs = [], [], [], []
+        for level in range(max_depth + 1):
+            level_keys = keys >> np.uint64(2 * (max_depth - level))
+            start = np.flatnonzero(np.r_[True, level_keys[1:] != level_keys[:-1]])
+            end = np.r_[start[1:], n]
+
+            starts.append(start)
+            ends.append(end)
+            sizes.append(np.full(len(start), span / 2**level))
+            leafs.append((end - start == 1) | (level == max_depth))
+
+            # Stop refining once every body sits in its own cell
+            if leafs[-1].all():
+                break
+
+        # Children of a node are the nodes of the next level inside its body range
+        offsets = np.cumsum([0] + [len(s) for s in starts])
+        child_start, child_end = [], []
+        for level in range(len(starts)):
+            if level + 1 < len(starts):
+                child_start.append(offsets[level + 1] + np.searchsorted(starts[level + 1], starts[level]))
+                child_end.append(offsets[level + 1] + np.searchsorted(starts[level + 1], ends[level]))
+            else:
+                child_start.append(np.zeros(len(starts[level]), dtype=np.int64))
+                child_end.append(np.zeros(len(starts[level]), dtype=np.int64))
+
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.size = np.concatenate(sizes)
+        self.leaf = np.concatenate(leafs)
+        self.child_start = np.concatenate(child_start)
+        self.child_end = np.concatenate(child_end)
+
+        # Mass and center of mass of each node
+        cumulative_mass = np.r_[0.0, np.cumsum(sorted_masses)]
+        cumulative_moment = np.vstack([np.zeros(2), np.cumsum(sorted_moments, axis=0)])
+        self.mass = cumulative_mass[self.end] - cumulative_mass[self.start]
+        moment = cumulative_moment[self.end] - cumulative_moment[self.start]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.com = np.where(self.mass[:, None] > 0, moment / self.mass[:, None], 0.0)
+
+    def __len__(self) -> int:
+        return len(self.mass)
+
+    def accelerations(
+        self,
+        positions: np.ndarray,
+        masses: np.ndarray,
+        theta: float = OrbitSettings.BARNES_HUT_THETA,
+        G: float = OrbitSettings.G,
+        chunk: int = 4096,
+        eps: float = 1e-6,
+    ) -> np.ndarray:
+        """Approximate gravitational acceleration of the bodies the tree was built from.
+        A node is used as a point mass when it is a leaf or when size / distance < theta.
+        The body itself is removed from the nodes that contain it.
+        The tree is walked for all bodies of a chunk at once, one level of (body, node) pairs at a time.
+        """
+        n = len(positions)
+        acc = np.zeros((n, 2), dtype=np.float64)
+
+        for chunk_start in range(0, n, chunk):
+            chunk_stop = min(chunk_start + chunk, n)
+
+            # Frontier of (body, node) pairs, starting at the root
+            body = np.arange(chunk_start, chunk_stop)
+            node = np.zeros(len(body), dtype=np.int64)
+
+            while len(body):
+                p, m = positions[body], masses[body]
+                d = self.com[node] - p
+                r2 = np.einsum("ij,ij->i", d, d)
+
+                opened = ~self.leaf[node] & (self.size[node] ** 2 >= theta**2 * r2)
+
+                # Point mass interaction for the accepted nodes, without the body's own mass
+                accepted = ~opened
+                b, k = body[accepted], node[accepted]
+                contains = (self.start[k] <= self.rank[b]) & (self.rank[b] < self.end[k])
+                own_mass = np.where(contains, m[accepted], 0.0)
+                node_mass = self.mass[k] - own_mass
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    com = (self.com[k] * self.mass[k][:, None] - p[accepted] * own_mass[:, None]) / node_mass[:, None]
+                    d = com - p[accepted]
+                    r2 = np.einsum("ij,ij->i", d, d)
+                    w = G * node_mass / r2**1.5
+                valid = (node_mass > 0) & (r2 >= eps**2)
+                w, d = np.where(valid, w, 0.0), np.where(valid[:, None], d, 0.0)
+
+                local = b - chunk_start
+                acc[chunk_start:chunk_stop, 0] += np.bincount(local, weights=w * d[:, 0], minlength=chunk_stop - chunk_start)
+                acc[chunk_start:chunk_stop, 1] += np.bincount(local, weights=w * d[:, 1], minlength=chunk_stop - chunk_start)
+
+                # Replace the opened nodes with their children
+                k = node[opened]
+                counts = self.child_end[k] - self.child_start[k]
+                body = np.repeat(body[opened], counts)
+                node = _ragged_arange(self.child_start[k], counts)
+
+        return acc
+
+
+def barnes_hut_accelerations(
+    positions: np.ndarray,
+    masses: np.ndarray,
+    theta: float = OrbitSettings.BARNES_HUT_THETA,
+    G: float = OrbitSettings.G,
+) -> np.ndarray:
+    """Gravitational acceleration of every body using a Barnes-Hut quadtree with opening angle theta."""
+    if len(positions) < 2:
+        return np.zeros((len(positions), 2), dtype=np.float64)
+
+    return QuadTree(positions, masses).accelerations(positions, masses, theta=theta, G=G)
@@ -0,0 +1,92 @@
+from typing import Optional
+import numpy as np
+from orbit_simulation.body_store import BodyStore
+from orbit_simulation.gravity import acceleration_jerks
+from settings import OrbitSettings
+
+
+class BlockTimesteps:
+    """Leapfrog (kick-drift-kick) with an individual step for each body.
+    A step of length dt is split into blocks: a body on level l takes steps of dt / 2^l. The level is chosen
+    from the body's acceleration and jerk, so bodies skimming the sun take small steps while distant planets
+    take the whole dt at once.
+
+    The steps of all levels line up on a grid of dt / 2^max_level ticks. Every tick where a step ends, all
+    bodies drift to the tick and only the bodies whose step ends (the active bodies) have their accelerations
+    evaluated and are kicked. At the end of dt every body is synchronized again.
+    """
+
+    def __init__(self, max_level: int = OrbitSettings.BLOCK_MAX_LEVEL, eta: float = OrbitSettings.BLOCK_ETA):
+        self.max_level = max_level
+        self.eta = eta
+
+        # Accelerations and jerks at the end of the last step: (store, store version, acc, jerk)
+        self.cache: Optional[tuple[BodyStore, int, np.ndarray, np.ndarray]] = None
+
+        # Statistics of the last step: level of each body at its end, and the number of single-body force evaluations
+        self.levels = np.zeros(0, dtype=np.int64)
+        self.evaluations = 0
+
+    def forces(self, store: BodyStore, active: np.ndarray, n_body_sim: bool) -> tuple[np.ndarray, np.ndarray]:
+        """Acceleration and jerk of the active slots, due to all bodies (only the sun when not n_body_sim)."""
+        sources = len(store) if n_body_sim else 1
+        positions, velocities = store.positions, store.velocities
+        self.evaluations += len(active)
+        return acceleration_jerks(
+            positions[active], velocities[active], positions[:sources], velocities[:sources], store.masses[:sources]
+        )
+
+    def choose_levels(self, acc: np.ndarray, jerk: np.ndarray, dt: float) -> np.ndarray:
+        """Level of each body: the step dt / 2^level is at most eta times the time scale |a| / |da/dt|."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            h = self.eta * np.hypot(*acc.T) / np.hypot(*jerk.T)
+            levels = np.ceil(np.log2(dt / h))
+
+        # Bodies without jerk (e.g. the sun in a central field) take the whole step
+        return np.clip(np.nan_to_num(levels, nan=0.0, posinf=self.max_level, neginf=0.0), 0, self.max_level).astype(np.int64)
+
+    def step(self, store: BodyStore, dt: float, n_body_sim: bool = True) -> None:
+        """Advance all bodies of the store by dt."""
+        n = len(store)
+        positions, velocities = store.positions, store.velocities
+        ticks = 1 << self.max_level
+        tick_dt = dt / ticks
+        self.evaluations = 0
+
+        # The forces at the end of the last step are still valid unless the bodies changed since
+        cache = self.cache
+        if cache is not None and cache[0] is store and cache[1] == store.version:
+            acc, jerk = cache[2], cache[3]
+        else:
+            acc, jerk = self.forces(store, np.arange(n), n_body_sim)
+
+        # Every body starts a step: opening half kick
+        levels = self.choose_levels(acc, jerk, dt)
+        spans = ticks >> levels
+        velocities += acc * (0.5 * tick_dt * spans)[:, None]
+        ends = spans.copy()
+
+        now = 0
+        while now < ticks:
+            tick = int(ends.min())
+            positions += velocities * ((tick - now) * tick_dt)
+            now = tick
+
+            # Closing half kick of the steps that end now
+            active = np.flatnonzero(ends == now)
+            acc[active], jerk[active] = self.forces(store, active, n_body_sim)
+            velocities[active] += acc[active] * (0.5 * tick_dt * spans[active])[:, None]
+            if now == ticks:
+                break
+
+            # Next step of the active bodies: a finer level is always possible, a coarser one only if its
+            # steps start at this tick (the trailing zero bits of the tick tell the coarsest such level)
+            coarsest = self.max_level - ((now & -now).bit_length() - 1)
+            levels[active] = np.maximum(self.choose_levels(acc[active], jerk[active], dt), coarsest)
+            spans[active] = ticks >> levels[active]
+            velocities[active] += acc[active] * (0.5 * tick_dt * spans[active])[:, None]
+            ends[active] = now + spans[active]
+
+        store.touch()
+        self.cache = (store, store.version, acc, jerk)
+        self.levels = levels
@@ -0,0 +1,355 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import numpy as np
+from utils import Vector
+from settings import OrbitSettings
+
+if TYPE_CHECKING:
+    from orbit_simulation.celestial_body import CelestialBody
+
+
+class BodyStore:
+    """Structure-of-arrays storage for celestial bodies.
+    Positions, velocities, masses, sizes and colors live in contiguous arrays, one row per body.
+    Bodies are accessed through CelestialBody handles that point at a row (slot) of the store.
+    The row order matches the insertion order: slot 0 is the sun, the last slot is the latest body.
+
+    The position histories of all bodies share one buffer of rows: each column is the ring of one body, with
+    room for HISTORY_BUDGET bytes of points. Positions are sampled every HISTORY_DT simulated seconds and the points
+    of nearly straight stretches are dropped as they come in, so each body keeps its own ring head.
+    """
+
+    # Empty history points are parked far outside of any view, so they are clipped when drawn
+    HISTORY_EMPTY = 1e9
+
+    # A history point is two float32 coordinates
+    HISTORY_POINT_BYTES = 8
+
+    # Per-body arrays of the history rings
+    HISTORY_ARRAYS = ("_history_count", "_history_head", "_history_heading", "_history_turn")
+
+    def __init__(self, capacity: int = 16, history_length: int = OrbitSettings.HISTORY_BUDGET // HISTORY_POINT_BYTES):
+        capacity = max(1, capacity)
+        self._positions = np.zeros((capacity, 2), dtype=np.float64)
+        self._velocities = np.zeros((capacity, 2), dtype=np.float64)
+        self._masses = np.zeros(capacity, dtype=np.float64)
+        self._sizes = np.zeros(capacity, dtype=np.float64)
+        self._colors = np.zeros((capacity, 3), dtype=np.uint8)
+
+        # Unique id of each body, it stays the same when the rows are compacted
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self.next_id = 0
+
+        # History rings (history_length, capacity, 2): the next point of a body goes into row _history_head of its column
+        self._history = np.full((history_length, capacity, 2), self.HISTORY_EMPTY, dtype=np.float32)
+        self._history_count = np.zeros(capacity, dtype=np.int64)
+        self._history_head = np.zeros(capacity, dtype=np.int64)
+
+        # Simplification state: heading (velocity) at the last sample, and turn of the heading since the last kept point
+        self._history_heading = np.zeros((capacity, 2), dtype=np.float64)
+        self._history_turn = np.zeros(capacity, dtype=np.float64)
+
+        # Simulated time of the last sample
+        self.history_time = -np.inf
+
+        # Number of samples so far, the sample each row was last written in, and a counter of changes that
+        # rewrite the buffer (for GPU uploads)
+        self.history_steps = 0
+        self._history_written = np.zeros(history_length, dtype=np.int64)
+        self.history_version = 0
+
+        # Handles in slot order
+        self.handles: list[CelestialBody] = []
+
+        # Incremented whenever bodies are added, removed or moved
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.handles)
+
+    @property
+    def capacity(self) -> int:
+        return len(self._masses)
+
+    # Views of the occupied rows:
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:len(self)]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        return self._velocities[:len(self)]
+
+    @property
+    def masses(self) -> np.ndarray:
+        return self._masses[:len(self)]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return self._sizes[:len(self)]
+
+    @property
+    def colors(self) -> np.ndarray:
+        return self._colors[:len(self)]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:len(self)]
+
+    def touch(self) -> None:
+        """Mark the state as changed."""
+        self.version += 1
+
+    @property
+    def history_length(self) -> int:
+        return len(self._history)
+
+    @property
+    def history_buffer(self) -> np.ndarray:
+        """The whole history ring buffer (history_length, capacity, 2), including the empty slots."""
+        return self._history
+
+    @property
+    def history_counts(self) -> np.ndarray:
+        """Number of recorded positions of each body."""
+        return self._history_count[:len(self)]
+
+    @property
+    def history_heads(self) -> np.ndarray:
+        """Row of the next position of each body, its recorded positions are the count rows before it."""
+        return self._history_head[:len(self)]
+
+    @property
+    def history_written(self) -> np.ndarray:
+        """The sample (history_steps) each row of the history buffer was last written in."""
+        return self._history_written
+
+    def history(self, slot: int) -> np.ndarray:
+        """Recorded positions (count, 2) of the body in slot, from oldest to newest."""
+        count = self._history_count[slot]
+        rows = (self._history_head[slot] - count + np.arange(count)) % self.history_length
+        return self._history[rows, slot]
+
+    def sample_history(self, time: float, interval: float = OrbitSettings.HISTORY_DT) -> bool:
+        """Record the current positions if at least interval simulated seconds passed since the last sample."""
+        if time < self.history_time + interval - 1e-9:
+            return False
+
+        self.append_history()
+        self.history_time = time
+        return True
+
+    def append_history(self, tolerance: float = OrbitSettings.HISTORY_TOLERANCE) -> None:
+        """Record the current positions of all bodies, dropping the points of nearly straight stretches.
+        The newest point of a body (its tail) is only kept while the path bends: while the trail through the dropped
+        points strays at most tolerance from the line between the last kept point and the new position, the new
+        position replaces the tail. An arc with chord c that turns by t radians strays about c * t / 8 from the chord.
+        """
+        n, length, capacity = len(self), self.history_length, self._history.shape[1]
+        count, head = self._history_count[:n], self._history_head[:n]
+
+        # Points and vectors as complex numbers: the rings are one flat array indexed by row * capacity + slot
+        points = self._history.view(np.complex64).reshape(-1)
+        slots = np.arange(n)
+        positions = self.positions.view(np.complex128)[:, 0]
+        velocities = self.velocities.view(np.complex128)[:, 0]
+        previous = self._history_heading[:n].view(np.complex128)[:, 0]
+
+        # Turn of the heading since the last sample (the angle between the velocities, which need no normalizing),
+        # added to the turn since the last kept point
+        turn = np.abs(np.angle(velocities * previous.conj()))
+        total_turn = self._history_turn[:n] + turn
+
+        # Replace the tail on a straight path, the last kept point is the one before the tail (rows wrap around)
+        kept = head - 2
+        kept += length * (kept < 0)
+        chord = np.abs(positions - points[kept * capacity + slots])
+        replace = (count >= 2) & (chord * total_turn <= 8 * tolerance)
+        rows = head - replace
+        rows += length * (rows < 0)
+
+        self.history_steps += 1
+        points[rows * capacity + slots] = positions
+        self._history_written[rows] = self.history_steps
+        head = rows + 1
+        head[head == length] = 0
+        self._history_head[:n] = head
+        self._history_count[:n] = np.minimum(count + ~replace, length)
+        self._history_heading[:n] = self.velocities
+
+        # A new point is kept only one sample after the tail it follows
+        self._history_turn[:n] = np.where(replace, total_turn, turn)
+
+    def clear_history(self, slots=None) -> None:
+        """Forget the recorded positions of the given slots (all bodies by default)."""
+        if slots is None:
+            slots = slice(None)
+            self.history_time = -np.inf
+
+        self._history[:, slots] = self.HISTORY_EMPTY
+        self._history_count[slots] = 0
+        self._history_heading[slots] = 0.0
+        self._history_turn[slots] = 0.0
+        self.history_version += 1
+
+    def reserve(self, capacity: int) -> None:
+        """Grow the arrays to hold at least capacity bodies. Existing rows are kept."""
+        if capacity <= self.capacity:
+            return
+
+        n = len(self)
+        for name in ("_positions", "_velocities", "_masses", "_sizes", "_colors", "_ids", *self.HISTORY_ARRAYS):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+
+        history = np.full((self.history_length, capacity, 2), self.HISTORY_EMPTY, dtype=np.float32)
+        history[:, :n] = self._history[:, :n]
+        self._history = history
+        self.history_version += 1
+
+    def append(self, body: CelestialBody, position: Vector, velocity: Vector, mass: float, size: float, color) -> int:
+        """Write the state into a new row and bind the body handle to it."""
+        slot = len(self)
+        if slot == self.capacity:
+            self.reserve(2 * self.capacity)
+
+        self._positions[slot] = position
+        self._velocities[slot] = velocity
+        self._masses[slot] = mass
+        self._sizes[slot] = size
+        self._colors[slot] = color[:3]
+        self._ids[slot] = self.next_id
+        self._history_count[slot] = 0
+        self._history_head[slot] = 0
+        self._history_heading[slot] = 0.0
+        self._history_turn[slot] = 0.0
+        self.next_id += 1
+
+        self.handles.append(body)
+        body.store, body.slot = self, slot
+        self.touch()
+        return slot
+
+    def adopt(self, body: CelestialBody) -> CelestialBody:
+        """Move a body (and its state) from its current store into this one."""
+        self.append(body, body.position.copy(), body.velocity.copy(), body.mass, body.size, body.color)
+        return body
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Views of the occupied rows and of the history ring buffer, e.g. to save a snapshot."""
+        n = len(self)
+        return dict(
+            positions=self.positions,
+            velocities=self.velocities,
+            masses=self.masses,
+            sizes=self.sizes,
+            colors=self.colors,
+            ids=self.ids,
+            history=self._history[:, :n],
+            history_count=self._history_count[:n],
+            history_head=self._history_head[:n],
+        )
+
+    @classmethod
+    def from_state(cls, arrays: dict[str, np.ndarray]) -> BodyStore:
+        """New store holding a copy of the arrays given by state(), with a fresh handle for each row."""
+        from orbit_simulation.celestial_body import CelestialBody
+
+        n = len(arrays["masses"])
+        store = cls(capacity=n, history_length=len(arrays["history"]))
+        for name in ("positions", "velocities", "masses", "sizes", "colors", "history_count", "history_head"):
+            getattr(store, f"_{name}")[:n] = arrays[name]
+
+        store._ids[:n] = arrays["ids"] if "ids" in arrays else np.arange(n)
+        store.next_id = int(store.ids.max(initial=-1)) + 1
+
+        store._history[:, :n] = arrays["history"]
+
+        # Bind handles to the rows directly, without the private store of a new body
+        for slot in range(n):
+            body = CelestialBody.__new__(CelestialBody)
+            body.store, body.slot = store, slot
+            store.handles.append(body)
+
+        return store
+
+    def load_frame(self, ids, positions, velocities, masses, sizes, colors) -> None:
+        """Replace all rows with the given bodies, e.g. a recorded step.
+        Rows are matched by body id: a body that was already in the store keeps its history.
+        """
+        n = len(ids)
+        if n != len(self) or not np.array_equal(ids, self.ids):
+            self.rebind(np.asarray(ids))
+
+        self._positions[:n] = positions
+        self._velocities[:n] = velocities
+        self._masses[:n] = masses
+        self._sizes[:n] = sizes
+        self._colors[:n] = colors
+        self.touch()
+
+    def rebind(self, ids: np.ndarray) -> None:
+        """Resize to the bodies with the given ids. The histories move along with the ids, new handles are bound to the rows."""
+        from orbit_simulation.celestial_body import CelestialBody
+
+        n, old_n = len(ids), len(self)
+        self.reserve(n)
+
+        # Ids only grow along the rows, so the rows of known ids are found by binary search
+        old_ids = self.ids.copy()
+        rows = np.minimum(np.searchsorted(old_ids, ids), max(old_n - 1, 0))
+        known = (rows < old_n) & (old_ids[rows] == ids) if old_n else np.zeros(n, dtype=bool)
+
+        history = np.full((self.history_length, n, 2), self.HISTORY_EMPTY, dtype=np.float32)
+        history[:, known] = self._history[:, rows[known]]
+        moved = [getattr(self, name)[rows] for name in self.HISTORY_ARRAYS]
+
+        self._history[:, :n] = history
+        self._history[:, n:old_n] = self.HISTORY_EMPTY
+        for name, array in zip(self.HISTORY_ARRAYS, moved):
+            array[~known] = 0
+            getattr(self, name)[:n] = array
+        self._ids[:n] = ids
+        self.next_id = max(self.next_id, int(ids.max(initial=-1)) + 1)
+        self.history_version += 1
+
+        for body in self.handles[n:]:
+            body.detach()
+        del self.handles[n:]
+        for slot in range(len(self.handles), n):
+            body = CelestialBody.__new__(CelestialBody)
+            body.store, body.slot = self, slot
+            self.handles.append(body)
+
+    def remove(self, slots) -> list[CelestialBody]:
+        """Remove the bodies at the given slots with a single order-preserving compaction pass.
+        The removed handles are detached into private stores, so they keep their last state.
+        """
+        n = len(self)
+        keep = np.ones(n, dtype=bool)
+        keep[np.asarray(slots, dtype=np.intp)] = False
+        if keep.all():
+            return []
+
+        removed = [body for body, k in zip(self.handles, keep) if not k]
+        for body in removed:
+            body.detach()
+
+        # Compact the arrays
+        m = int(keep.sum())
+        for name in ("_positions", "_velocities", "_masses", "_sizes", "_colors", "_ids", *self.HISTORY_ARRAYS):
+            arr = getattr(self, name)
+            arr[:m] = arr[:n][keep]
+
+        self._history[:, :m] = self._history[:, :n][:, keep]
+        self._history[:, m:n] = self.HISTORY_EMPTY
+        self.history_version += 1
+
+        self.handles = [body for body, k in zip(self.handles, keep) if k]
+        for slot, body in enumerate(self.handles):
+            body.slot = slot
+
+        self.touch()
+        return removed
@@ -1,68 +1,93 @@
 from __future__ import annotations
 from typing import Optional
 import numpy as np
-from dataclasses import dataclass, field
-from utils import Vector, normalize
-from collections import deque
+from utils import Vector
 from settings import Color, OrbitSettings
+from orbit_simulation.body_store import BodyStore
 
 
 def random_color():
     return tuple(np.random.randint(70, 255, size=3))
 
 
-@dataclass
 class CelestialBody:
     """Object in space: described by position and velocity.
-    Each object maintains a history of positions in screen and world coordinates.
+    The state is a view into a row of a BodyStore. A body created on its own owns a single row store
+    until it is adopted by a simulator.
+    The history of positions is kept in the ring buffer of the store.
     """
 
-    position: np.ndarray = field(default=np.zeros(2, dtype=np.float64))
-    velocity: np.ndarray = field(default=np.zeros(2, dtype=np.float64))
-    mass: float = 1.0
-    size: float = 5.0
-    color: Optional[tuple] = field(default_factory=random_color, repr=False)
-    history: deque[tuple[float, float]] = field(
-        default=deque(maxlen=OrbitSettings.HISTORY_LENGTH), repr=False
-    )
-    __virtual: bool = False
+    def __init__(
+        self,
+        position: Vector = (0.0, 0.0),
+        velocity: Vector = (0.0, 0.0),
+        mass: float = 1.0,
+        size: float = 5.0,
+        color: Optional[tuple] = None,
+    ):
+        self.store: BodyStore
+        self.slot: int
+        BodyStore(capacity=1).append(self, position, velocity, mass, size, color or random_color())
+
+    def __repr__(self) -> str:
+        return f"CelestialBody(position={self.position}, velocity={self.velocity}, mass={self.mass}, size={self.size})"
 
-    def __post_init__(self):
-        self.position = np.array(self.position, dtype=np.float64)
-        self.velocity = np.array(self.velocity, dtype=np.float64)
+    @property
+    def position(self) -> np.ndarray:
+        return self.store._positions[self.slot]
+
+    @position.setter
+    def position(self, value: Vector):
+        self.store._positions[self.slot] = value
+        self.store.touch()
 
     @property
-    def virtual(self) -> bool:
-        return self.virtual
+    def velocity(self) -> np.ndarray:
+        return self.store._velocities[self.slot]
 
-    @virtual.setter
-    def virtual(self, value: bool):
-        """Virtual bodies are used to predict the future. The history of the virtual body can."""
-        self.__virtual = value
-        self.history = deque(maxlen=OrbitSettings.FUTURE_LENGTH)
+    @velocity.setter
+    def velocity(self, value: Vector):
+        self.store._velocities[self.slot] = value
+        self.store.touch()
 
-    @staticmethod
-    def gravitational_force(a: CelestialBody, b: CelestialBody) -> np.ndarray:
-        # Relative position
-        direction, distance = normalize(b.position - a.position)
+    @property
+    def mass(self) -> float:
+        return float(self.store._masses[self.slot])
+
+    @mass.setter
+    def mass(self, value: float):
+        self.store._masses[self.slot] = value
+        self.store.touch()
 
-        # Newton's law
-        return direction * (OrbitSettings.G * a.mass * b.mass / distance**2)
+    @property
+    def size(self) -> float:
+        return float(self.store._sizes[self.slot])
+
+    @size.setter
+    def size(self, value: float):
+        self.store._sizes[self.slot] = value
+        self.store.touch()
 
-    def is_too_far_away(self, screen_size: Vector) -> bool:
-        """Check whether the body is far away from the viewport."""
-        return (abs(self.position) > 2 * screen_size).all()
+    @property
+    def color(self) -> tuple:
+        return tuple(int(c) for c in self.store._colors[self.slot])
 
-    def is_too_close_to_sun(self, sun: CelestialBody) -> bool:
-        """Check whether the body is close to the Sun object."""
-        if self is sun:
-            return False
+    @color.setter
+    def color(self, value: tuple):
+        self.store._colors[self.slot] = value[:3]
+        self.store.touch()
+
+    @property
+    def history(self) -> np.ndarray:
+        """Recorded positions (count, 2), from oldest to newest."""
+        return self.store.history(self.slot)
 
-        _, dist = normalize(self.position - sun.position)
-        return dist < sun.size + self.size + OrbitSettings.SUN_DESTRUCTION_RANGE
+    def detach(self) -> None:
+        """Copy the state into a private store, so the handle stays valid after removal from its store."""
+        BodyStore(capacity=1).append(self, self.position.copy(), self.velocity.copy(), self.mass, self.size, self.color)
 
     def clear_history(self) -> None:
-        self.history.clear()
+        self.store.clear_history([self.slot])
 
     @staticmethod
     def make_sun() -> CelestialBody:
@@ -0,0 +1,92 @@
+import numpy as np
+from functools import lru_cache
+from typing import Optional
+from orbit_simulation.barnes_hut import _ragged_arange
+from settings import OrbitSettings
+
+# Neighbour cells visited from each cell: itself and half of the 8 surrounding cells, so every pair of cells is visited once
+_NEIGHBOURS = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+def collision_pairs(
+    positions: np.ndarray, sizes: np.ndarray, cell_size: Optional[float] = None, min_grid: int = OrbitSettings.COLLISION_GRID_MIN_BODIES,
+) -> np.ndarray:
+    """Pairs (M, 2) of touching bodies (i < j), found with a uniform grid broad phase.
+    The cells are as large as the largest body (diameter), so touching bodies are in the same or adjacent cells.
+    The bodies are sorted by cell, and the bodies of each neighbour cell are looked up as a range of the sorted order.
+    Below min_grid bodies all pairs are tested instead, which is faster than setting up the grid.
+    """
+    n = len(positions)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.intp)
+
+    if n < min_grid:
+        return _touching(positions, sizes, *_all_pairs(n))
+
+    cell_size = cell_size or 2 * float(sizes.max())
+
+    # Cell of each body, offset by one so neighbour keys never wrap around a row
+    cells = np.floor(positions / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    width = int(cells[:, 0].max()) + 2
+    keys = cells[:, 1] * width + cells[:, 0]
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    # Broad phase: candidate pairs of bodies in neighbouring cells (looked up in sorted order, which is much faster)
+    first, second = [], []
+    for dx, dy in _NEIGHBOURS:
+        neighbour_keys = sorted_keys + dy * width + dx
+        start = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+        counts = np.searchsorted(sorted_keys, neighbour_keys, side="right") - start
+
+        i = np.repeat(order, counts)
+        j = order[_ragged_arange(start, counts)]
+        if (dx, dy) == (0, 0):
+            i, j = i[i < j], j[i < j]
+
+        first.append(i)
+        second.append(j)
+
+    return _touching(positions, sizes, np.concatenate(first), np.concatenate(second))
+
+
+@lru_cache(maxsize=OrbitSettings.COLLISION_GRID_MIN_BODIES)
+def _all_pairs(n: int) -> tuple[np.ndarray, np.ndarray]:
+    """Slots (i, j) of every pair i < j of n bodies."""
+    return np.triu_indices(n, k=1)
+
+
+def _touching(positions: np.ndarray, sizes: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Narrow phase: the candidate pairs whose circles overlap, as (min, max) slot pairs."""
+    d = positions[i] - positions[j]
+    touching = np.einsum("ij,ij->i", d, d) < (sizes[i] + sizes[j]) ** 2
+
+    pairs = np.stack([np.minimum(i, j), np.maximum(i, j)], axis=1)[touching]
+    return pairs
+
+
+def group_labels(pairs: np.ndarray, n: int) -> np.ndarray:
+    """Label (n,) of each body: the lowest slot of the group of bodies connected to it by touching pairs.
+    A chain of three touching bodies is one group. Bodies that touch nothing are labelled with their own slot.
+    """
+    labels = np.arange(n)
+    i, j = pairs[:, 0], pairs[:, 1]
+
+    while True:
+        # Pairs of touching bodies that are still in different groups
+        split = labels[i] != labels[j]
+        if not split.any():
+            return labels
+
+        # Hook the larger group label onto the smaller one
+        a, b = labels[i[split]], labels[j[split]]
+        np.minimum.at(labels, np.maximum(a, b), np.minimum(a, b))
+
+        # Pointer jumping: relabel with the label of the label until every label is a group root
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
@@ -0,0 +1,207 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Optional
+from orbit_simulation.celestial_body import CelestialBody
+from orbit_simulation.orbit_simulator import OrbitSimulator
+from profiling import PROFILER
+from settings import AppSettings, OrbitSettings
+
+# Initial conditions of the launched body of each run
+LAUNCH_DTYPE = np.dtype([
+    ("position", "<f8", (2,)),
+    ("velocity", "<f8", (2,)),
+    ("mass", "<f8"),
+])
+
+# Fate of the launched body
+SURVIVED, SUN_IMPACT, ESCAPED, MERGED = range(4)
+FATES = ("survived", "sun_impact", "escaped", "merged")
+
+# Metrics of each run
+RESULT_DTYPE = np.dtype([
+    ("fate", "i1"),
+    ("survival_time", "<f8"),
+    ("min_distance", "<f8"),
+    ("max_distance", "<f8"),
+    ("final_position", "<f8", (2,)),
+    ("final_velocity", "<f8", (2,)),
+])
+
+
+def launch_grid(radius, speed, angle=(90.0,), mass=(OrbitSettings.ENSEMBLE_LAUNCH_MASS,)) -> np.ndarray:
+    """Launches at every combination of the given values.
+    The body starts at distance radius on the +x axis, with the velocity speed * (cos(angle), sin(angle)), angle in degrees:
+    90 is a prograde launch perpendicular to the sun direction.
+    """
+    radius, speed, angle, mass = (grid.ravel() for grid in np.meshgrid(radius, speed, angle, mass, indexing="ij"))
+    return _launches(radius, speed, angle, mass)
+
+
+def launch_sample(
+    n: int, radius: tuple[float, float], speed: tuple[float, float], angle: tuple[float, float] = (90.0, 90.0),
+    mass: tuple[float, float] = (OrbitSettings.ENSEMBLE_LAUNCH_MASS,) * 2, seed: Optional[int] = None,
+) -> np.ndarray:
+    """n launches with each parameter drawn uniformly from its (low, high) range, see launch_grid."""
+    rng = np.random.default_rng(seed)
+    return _launches(*(rng.uniform(low, high, n) for low, high in (radius, speed, angle, mass)))
+
+
+def _launches(radius, speed, angle, mass) -> np.ndarray:
+    launches = np.zeros(len(radius), dtype=LAUNCH_DTYPE)
+    launches["position"][:, 0] = radius
+    angle = np.radians(angle)
+    launches["velocity"] = speed[:, None] * np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    launches["mass"] = mass
+    return launches
+
+
+class _TrackingSimulator(OrbitSimulator):
+    """Simulator that tells why the launched body was removed."""
+
+    def __init__(self, launched: CelestialBody, bodies: Optional[list[CelestialBody]]):
+        super().__init__(destr_callback=lambda events, kind: None, bodies=bodies)
+        self.launched = self.store.adopt(launched)
+        self.fate = SURVIVED
+
+    @property
+    def alive(self) -> bool:
+        # Removed bodies are detached into their own store
+        return self.launched.store is self.store
+
+    def destruction_check(self, screen_size):
+        position = self.launched.position.copy() if self.alive else None
+        super().destruction_check(screen_size)
+
+        if position is not None and not self.alive:
+            self.fate = ESCAPED if (np.abs(position) > 2 * np.asarray(screen_size)).all() else SUN_IMPACT
+
+    def collision_check(self):
+        alive = self.alive
+        super().collision_check()
+
+        if alive and not self.alive:
+            self.fate = MERGED
+
+
+def run_launch(
+    launch: np.void, steps: int, dt: float, screen_size: tuple[int, int], bodies: Optional[list[CelestialBody]] = None,
+) -> tuple:
+    """Simulate one launch until the launched body is removed or for the given steps. Returns a RESULT_DTYPE record."""
+    launched = CelestialBody(position=launch["position"], velocity=launch["velocity"], mass=float(launch["mass"]))
+    sim = _TrackingSimulator(launched, bodies=[_copy_body(body) for body in bodies] if bodies is not None else None)
+    screen_size = np.asarray(screen_size)
+
+    min_distance = max_distance = np.hypot(*(launched.position - sim.store.positions[0]))
+    for _ in range(steps):
+        sim.step(dt=dt, screen_size=screen_size)
+        if not sim.alive:
+            break
+
+        distance = np.hypot(*(sim.launched.position - sim.store.positions[0]))
+        min_distance, max_distance = min(min_distance, distance), max(max_distance, distance)
+
+    return sim.fate, sim.time, min_distance, max_distance, launched.position, launched.velocity
+
+
+def _copy_body(body: CelestialBody) -> CelestialBody:
+    return CelestialBody(body.position.copy(), body.velocity.copy(), body.mass, body.size, tuple(int(c) for c in body.color))
+
+
+@dataclass
+class EnsembleResult:
+    """Launches of an ensemble and the metrics of their runs, row by row."""
+
+    launches: np.ndarray
+    results: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def fate(self, fate: int) -> np.ndarray:
+        """Mask of the runs that ended with the given fate."""
+        return self.results["fate"] == fate
+
+    def summary(self) -> dict:
+        """Number of runs with each fate and the mean survival time."""
+        counts = np.bincount(self.results["fate"], minlength=len(FATES))
+        return dict(
+            runs=len(self),
+            **{name: int(count) for name, count in zip(FATES, counts)},
+            mean_survival_time=float(self.results["survival_time"].mean()) if len(self) else 0.0,
+        )
+
+
+# Arrays of the running ensemble in a worker process, attached to the shared memory by the pool initializer
+_shared: dict = {}
+
+
+def _init_worker(launches_name: str, results_name: str, n: int, steps: int, dt: float, screen_size, body_states) -> None:
+    PROFILER.enabled = False
+    for key, name, dtype in (("launches", launches_name, LAUNCH_DTYPE), ("results", results_name, RESULT_DTYPE)):
+        memory = shared_memory.SharedMemory(name=name)
+        _shared[key] = np.ndarray(n, dtype=dtype, buffer=memory.buf)
+        _shared[f"{key}_memory"] = memory
+
+    bodies = None if body_states is None else [CelestialBody(*state) for state in body_states]
+    _shared.update(steps=steps, dt=dt, screen_size=screen_size, bodies=bodies)
+
+
+def _run_chunk(start: int, stop: int) -> int:
+    """Run the launches start:stop, writing their metrics straight into the shared result array."""
+    launches, results = _shared["launches"], _shared["results"]
+    for k in range(start, stop):
+        results[k] = run_launch(launches[k], _shared["steps"], _shared["dt"], _shared["screen_size"], _shared["bodies"])
+    return stop - start
+
+
+def run_ensemble(
+    launches: np.ndarray, steps: int, dt: float = OrbitSettings.FIXED_DT,
+    screen_size: tuple[int, int] = (AppSettings.WIDTH_INIT, AppSettings.HEIGHT_INIT),
+    bodies: Optional[list[CelestialBody]] = None, workers: Optional[int] = None,
+    chunks_per_worker: int = OrbitSettings.ENSEMBLE_CHUNKS_PER_WORKER,
+) -> EnsembleResult:
+    """Run one independent simulation per launch on a pool of processes: the bodies (the sun and earth by default)
+    plus the launched body, for the given steps or until the launched body is removed.
+
+    The launches and the results live in shared memory: each worker reads its launches and writes the metrics of
+    its runs in place, so only the chunk bounds go through the pool. There are several chunks per worker, so the
+    workers stay busy when some runs end early.
+    """
+    workers = workers or os.cpu_count() or 1
+    n = len(launches)
+    results = np.zeros(n, dtype=RESULT_DTYPE)
+    if not n:
+        return EnsembleResult(launches=launches, results=results)
+
+    launches_memory = shared_memory.SharedMemory(create=True, size=n * LAUNCH_DTYPE.itemsize)
+    results_memory = shared_memory.SharedMemory(create=True, size=n * RESULT_DTYPE.itemsize)
+    try:
+        shared_launches = np.ndarray(n, dtype=LAUNCH_DTYPE, buffer=launches_memory.buf)
+        shared_results = np.ndarray(n, dtype=RESULT_DTYPE, buffer=results_memory.buf)
+        shared_launches[:] = launches
+
+        # Bodies are sent as plain tuples, a CelestialBody refers to its store
+        body_states = None if bodies is None else [
+            (body.position.tolist(), body.velocity.tolist(), body.mass, body.size, tuple(int(c) for c in body.color)) for body in bodies
+        ]
+        bounds = np.linspace(0, n, min(n, workers * chunks_per_worker) + 1).astype(int)
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(launches_memory.name, results_memory.name, n, steps, dt, tuple(screen_size), body_states),
+        ) as pool:
+            done = sum(pool.map(_run_chunk, bounds[:-1], bounds[1:]))
+        assert done == n
+
+        results[:] = shared_results
+        del shared_launches, shared_results
+    finally:
+        for memory in (launches_memory, results_memory):
+            memory.close()
+            memory.unlink()
+
+    return EnsembleResult(launches=np.array(launches), results=results)
+
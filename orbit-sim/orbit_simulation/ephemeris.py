@@ -0,0 +1,60 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+
+
+@dataclass
+class Ephemeris:
+    """Future states of the bodies sampled every dt, starting at t = 0.
+    Between the samples the positions are interpolated with cubic Hermite splines, so integrators
+    that evaluate forces at intermediate times get source positions of matching (4th order) accuracy.
+    The half-way points, where leapfrog evaluates its forces, are interpolated for all samples at once and cached.
+    """
+
+    # Positions and velocities (samples, N, 2)
+    positions: np.ndarray
+    velocities: np.ndarray
+    dt: float
+
+    # Positions (samples - 1, N, 2) half-way between the samples, computed on first use
+    _midpoints: Optional[np.ndarray] = field(default=None, init=False, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __getitem__(self, item) -> "Ephemeris":
+        """Ephemeris of a subset of the bodies."""
+        return Ephemeris(self.positions[:, item], self.velocities[:, item], self.dt)
+
+    @property
+    def midpoints(self) -> np.ndarray:
+        """Positions half-way between each sample and the next one: the Hermite spline at s = 1/2."""
+        if self._midpoints is None:
+            p, v = self.positions, self.velocities
+            self._midpoints = 0.5 * (p[:-1] + p[1:]) + (0.125 * self.dt) * (v[:-1] - v[1:])
+        return self._midpoints
+
+    def at(self, t: float) -> np.ndarray:
+        """Positions (N, 2) of the bodies at time t."""
+        k, s = divmod(t / self.dt, 1.0)
+        k = int(k)
+
+        # Rounding can put a time on a sample just below it
+        if s > 1 - 1e-9:
+            k, s = k + 1, 0.0
+
+        # Exactly on a sample (or past the last one)
+        if s < 1e-9 or k + 1 >= len(self):
+            return self.positions[min(k, len(self) - 1)]
+
+        # Half-way between two samples
+        if abs(s - 0.5) < 1e-9:
+            return self.midpoints[k]
+
+        # Cubic Hermite basis
+        s2, s3 = s * s, s * s * s
+        h00, h10, h01, h11 = 2 * s3 - 3 * s2 + 1, s3 - 2 * s2 + s, 3 * s2 - 2 * s3, s3 - s2
+
+        p0, p1 = self.positions[k], self.positions[k + 1]
+        v0, v1 = self.velocities[k], self.velocities[k + 1]
+        return h00 * p0 + h01 * p1 + (h10 * v0 + h11 * v1) * self.dt
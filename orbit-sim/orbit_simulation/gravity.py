@@ -0,0 +1,109 @@
+import numpy as np
+from settings import OrbitSettings
+
+
+def direct_accelerations(
+    positions: np.ndarray,
+    masses: np.ndarray,
+    G: float = OrbitSettings.G,
+    tile_bytes: int = OrbitSettings.GRAVITY_TILE_BYTES,
+    eps: float = 1e-6,
+) -> np.ndarray:
+    """Gravitational acceleration of every body due to all other bodies (exact pairwise sum).
+    The (N, N) interaction matrix is evaluated in tiles of rows, so the temporaries of a single
+    tile stay below tile_bytes. Pairs closer than eps (including self-interaction) are ignored.
+    """
+    n = len(positions)
+    acc = np.zeros((n, 2), dtype=np.float64)
+    if n < 2:
+        return acc
+
+    x, y = positions[:, 0], positions[:, 1]
+
+    # Three (rows, n) float64 tiles are alive at once
+    rows = int(max(1, min(n, tile_bytes // (n * 3 * 8))))
+
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+
+        # Vector pointing from body i to body j:
+        dx = x[None, :] - x[start:stop, None]
+        dy = y[None, :] - y[start:stop, None]
+        r2 = dx * dx + dy * dy
+
+        # Newton's law: G * m_j / r^2 along the unit vector d / r
+        with np.errstate(divide="ignore"):
+            w = 1.0 / (r2 * np.sqrt(r2))
+        w[r2 < eps**2] = 0.0
+        w *= masses
+
+        acc[start:stop, 0] = G * np.einsum("ij,ij->i", w, dx)
+        acc[start:stop, 1] = G * np.einsum("ij,ij->i", w, dy)
+
+    return acc
+
+
+def central_accelerations(positions: np.ndarray, center: np.ndarray, mass: float, G: float = OrbitSettings.G) -> np.ndarray:
+    """Gravitational acceleration of each position due to a single mass at center."""
+    d = center - positions
+    r2 = np.einsum("ij,ij->i", d, d)
+    return G * mass * d / (r2 ** 1.5)[:, None]
+
+
+def field_accelerations(points: np.ndarray, sources: np.ndarray, masses: np.ndarray, G: float = OrbitSettings.G, eps: float = 1e-6) -> np.ndarray:
+    """Gravitational acceleration at each of the (K, 2) points due to the (N, 2) source masses."""
+    d = sources[None, :, :] - points[:, None, :]
+    r2 = np.einsum("ijk,ijk->ij", d, d)
+    with np.errstate(divide="ignore"):
+        w = 1.0 / (r2 * np.sqrt(r2))
+    w[r2 < eps**2] = 0.0
+    return G * np.einsum("ij,ijk->ik", w * masses, d)
+
+
+def acceleration_jerks(
+    points: np.ndarray,
+    point_velocities: np.ndarray,
+    sources: np.ndarray,
+    source_velocities: np.ndarray,
+    masses: np.ndarray,
+    G: float = OrbitSettings.G,
+    tile_bytes: int = OrbitSettings.GRAVITY_TILE_BYTES,
+    eps: float = 1e-6,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Gravitational acceleration and its time derivative (jerk) at each of the (K, 2) moving points
+    due to the (N, 2) moving source masses. Evaluated in tiles of rows like direct_accelerations.
+    """
+    k, n = len(points), len(sources)
+    acc = np.zeros((k, 2), dtype=np.float64)
+    jerk = np.zeros((k, 2), dtype=np.float64)
+    if not k or not n:
+        return acc, jerk
+
+    # Eight (rows, n) float64 tiles are alive at once
+    rows = int(max(1, min(k, tile_bytes // (n * 8 * 8))))
+
+    for start in range(0, k, rows):
+        stop = min(start + rows, k)
+
+        # Relative position and velocity of source j seen from point i
+        dx = sources[None, :, 0] - points[start:stop, None, 0]
+        dy = sources[None, :, 1] - points[start:stop, None, 1]
+        dvx = source_velocities[None, :, 0] - point_velocities[start:stop, None, 0]
+        dvy = source_velocities[None, :, 1] - point_velocities[start:stop, None, 1]
+        r2 = dx * dx + dy * dy
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = 1.0 / (r2 * np.sqrt(r2))
+            rv = 3.0 * (dx * dvx + dy * dvy) / r2
+        close = r2 < eps**2
+        w[close] = 0.0
+        rv[close] = 0.0
+        w *= masses
+
+        # d/dt (d / r^3) = dv / r^3 - 3 (d . dv) d / r^5
+        acc[start:stop, 0] = G * np.einsum("ij,ij->i", w, dx)
+        acc[start:stop, 1] = G * np.einsum("ij,ij->i", w, dy)
+        jerk[start:stop, 0] = G * np.einsum("ij,ij->i", w, dvx - rv * dx)
+        jerk[start:stop, 1] = G * np.einsum("ij,ij->i", w, dvy - rv * dy)
+
+    return acc, jerk
@@ -0,0 +1,178 @@
+from typing import Callable
+import numpy as np
+from settings import OrbitSettings
+
+# Acceleration of the bodies at time t and positions (N, 2)
+AccelerationFunction = Callable[[float, np.ndarray], np.ndarray]
+
+
+class Integrator:
+    """Advances positions and velocities (N, 2) in place over one step of length dt.
+    The accelerations are evaluated through a function of time and positions, so the same integrator
+    runs the simulation (time independent forces) and the predictions (sources taken from an ephemeris).
+    """
+
+    name = "integrator"
+
+    def step(self, t: float, positions: np.ndarray, velocities: np.ndarray, dt: float, acceleration: AccelerationFunction) -> None:
+        raise NotImplementedError
+
+
+class SymplecticIntegrator(Integrator):
+    """Drift-kick splitting: alternating position updates with the velocity (drifts) and
+    velocity updates with the acceleration (kicks), each scaled by its coefficient.
+    Symplectic schemes keep the energy error bounded, so orbits stay closed over long runs.
+    """
+
+    def __init__(self, name: str, drifts: tuple, kicks: tuple):
+        assert len(drifts) == len(kicks) + 1
+        self.name = name
+        self.drifts = drifts
+        self.kicks = kicks
+
+    def step(self, t, positions, velocities, dt, acceleration):
+        time = t
+        for drift, kick in zip(self.drifts, self.kicks):
+            if drift:
+                positions += velocities * (drift * dt)
+                time += drift * dt
+
+            velocities += acceleration(time, positions) * (kick * dt)
+
+        if self.drifts[-1]:
+            positions += velocities * (self.drifts[-1] * dt)
+
+
+# Yoshida's 4th order composition of three leapfrog steps
+_Y1 = 1 / (2 - 2 ** (1 / 3))
+_Y0 = -(2 ** (1 / 3)) * _Y1
+
+# Kick then drift, the scheme of the original simulator (first order)
+SEMI_IMPLICIT_EULER = SymplecticIntegrator("euler", drifts=(0.0, 1.0), kicks=(1.0,))
+
+# Drift-kick-drift leapfrog, equivalent to velocity Verlet (second order, one force evaluation per step)
+LEAPFROG = SymplecticIntegrator("leapfrog", drifts=(0.5, 0.5), kicks=(1.0,))
+
+# Fourth order, three force evaluations per step
+YOSHIDA4 = SymplecticIntegrator(
+    "yoshida4",
+    drifts=(_Y1 / 2, (_Y0 + _Y1) / 2, (_Y0 + _Y1) / 2, _Y1 / 2),
+    kicks=(_Y1, _Y0, _Y1),
+)
+
+
+class RungeKutta(Integrator):
+    """Explicit Runge-Kutta method given by its Butcher tableau (c, a, b), applied to x' = v, v' = acc(t, x)."""
+
+    def __init__(self, name: str, c: tuple, a: tuple, b: tuple):
+        self.name = name
+        self.c = c
+        self.a = a
+        self.b = b
+
+    def stages(self, t, positions, velocities, dt, acceleration) -> tuple[list, list]:
+        """Slopes of the positions (velocities) and of the velocities (accelerations) at each stage."""
+        kx, kv = [], []
+        for c, a in zip(self.c, self.a):
+            x, v = positions.copy(), velocities.copy()
+            for weight, dx, dv in zip(a, kx, kv):
+                if weight:
+                    x += dx * (weight * dt)
+                    v += dv * (weight * dt)
+
+            kx.append(v)
+            kv.append(acceleration(t + c * dt, x))
+
+        return kx, kv
+
+    @staticmethod
+    def combine(k: list, weights: tuple) -> np.ndarray:
+        return sum(weight * slope for weight, slope in zip(weights, k) if weight)
+
+    def step(self, t, positions, velocities, dt, acceleration):
+        kx, kv = self.stages(t, positions, velocities, dt, acceleration)
+        positions += self.combine(kx, self.b) * dt
+        velocities += self.combine(kv, self.b) * dt
+
+
+# Classic fourth order Runge-Kutta
+RK4 = RungeKutta(
+    "rk4",
+    c=(0.0, 0.5, 0.5, 1.0),
+    a=((), (0.5,), (0.0, 0.5), (0.0, 0.0, 1.0)),
+    b=(1 / 6, 1 / 3, 1 / 3, 1 / 6),
+)
+
+
+class AdaptiveRungeKutta(RungeKutta):
+    """Embedded Runge-Kutta pair with error control.
+    A step of length dt is covered with as many substeps as the local error estimate requires:
+    the substep shrinks near close encounters and grows back up to dt on smooth parts of the orbit.
+    """
+
+    def __init__(self, name: str, c: tuple, a: tuple, b: tuple, b_low: tuple, order: int,
+                 rtol: float = OrbitSettings.INTEGRATOR_RTOL, atol: float = OrbitSettings.INTEGRATOR_ATOL,
+                 max_substeps: int = OrbitSettings.INTEGRATOR_MAX_SUBSTEPS):
+        super().__init__(name, c, a, b)
+        self.error_weights = tuple(high - low for high, low in zip(b, b_low))
+        self.order = order
+        self.rtol = rtol
+        self.atol = atol
+        self.max_substeps = max_substeps
+
+    def error(self, positions, velocities, kx, kv, h) -> float:
+        """Largest local error estimate relative to the tolerance (accepted when <= 1)."""
+        error_x = np.abs(self.combine(kx, self.error_weights) * h) / (self.atol + self.rtol * np.abs(positions))
+        error_v = np.abs(self.combine(kv, self.error_weights) * h) / (self.atol + self.rtol * np.abs(velocities))
+        return max(float(error_x.max(initial=0.0)), float(error_v.max(initial=0.0)))
+
+    def step(self, t, positions, velocities, dt, acceleration):
+        end = t + dt
+        h = dt
+        h_min = dt / self.max_substeps
+
+        while end - t > 1e-12 * dt:
+            h = min(h, end - t)
+            kx, kv = self.stages(t, positions, velocities, h, acceleration)
+            error = self.error(positions, velocities, kx, kv, h)
+
+            # Reject and retry with a smaller substep, unless it is already the smallest allowed one
+            if error > 1.0 and h > h_min:
+                h = max(h_min, h * max(0.2, 0.9 * error ** (-1 / self.order)))
+                continue
+
+            positions += self.combine(kx, self.b) * h
+            velocities += self.combine(kv, self.b) * h
+            t += h
+
+            # Grow the next substep after a step with a small error
+            growth = min(5.0, 0.9 * error ** (-1 / self.order)) if error > 0 else 5.0
+            h = max(h_min, h * growth)
+
+
+# Dormand-Prince 5(4) pair
+DOPRI5 = AdaptiveRungeKutta(
+    "adaptive",
+    c=(0.0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1.0, 1.0),
+    a=(
+        (),
+        (1 / 5,),
+        (3 / 40, 9 / 40),
+        (44 / 45, -56 / 15, 32 / 9),
+        (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+        (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+        (35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+    ),
+    b=(35 / 384, 0.0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0.0),
+    b_low=(5179 / 57600, 0.0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100, 1 / 40),
+    order=5,
+)
+
+INTEGRATORS = {integrator.name: integrator for integrator in (SEMI_IMPLICIT_EULER, LEAPFROG, YOSHIDA4, RK4, DOPRI5)}
+
+
+def get_integrator(name: str) -> Integrator:
+    try:
+        return INTEGRATORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown integrator {name!r}, choose from {', '.join(INTEGRATORS)}") from None
@@ -1,122 +1,354 @@
-import arcade
-import arcade.color as color
+import numpy as np
 from utils import Vector
-from typing import Callable
+from typing import Callable, Optional
+from orbit_simulation.body_store import BodyStore
 from orbit_simulation.celestial_body import CelestialBody
-import itertools
-from copy import deepcopy
-from settings import OrbitSettings, Color
+from orbit_simulation.gravity import direct_accelerations, central_accelerations, field_accelerations
+from orbit_simulation.barnes_hut import barnes_hut_accelerations
+from orbit_simulation.block_timesteps import BlockTimesteps
+from orbit_simulation.collisions import collision_pairs, group_labels
+from orbit_simulation.ephemeris import Ephemeris
+from orbit_simulation.integrators import Integrator, get_integrator
+from orbit_simulation.predictor import AsyncPredictor, Prediction, aim_fan, raise_if
+from orbit_simulation.snapshot import Snapshot
+from orbit_simulation.recorder import TrajectoryRecorder
+from profiling import profiled
+from settings import OrbitSettings
+
+# Why bodies were removed, passed to the destruction callback with each batch of events
+SUN_IMPACT, ESCAPED, MERGED, DELETED = "sun_impact", "escaped", "merged", "deleted"
 
 
 class OrbitSimulator:
     """Keeps track of the celestial bodies and simulates their movement."""
 
-    def __init__(self, destr_callback: Callable):
-        self.bodies = [CelestialBody.make_sun(), CelestialBody.make_earth()]
+    def __init__(self, destr_callback: Callable[[list[tuple], str], None], bodies: Optional[list[CelestialBody]] = None):
+        # Body arrays, the sun is always in the first slot
+        self.store = BodyStore()
+        for body in bodies or [CelestialBody.make_sun(), CelestialBody.make_earth()]:
+            self.store.adopt(body)
 
-        # Destruction event function
+        # Destruction event function, called with a batch of (pos, vel, col) events and their kind (SUN_IMPACT, ...)
         self.destruction_callback = destr_callback
 
-        # Prediction bodies
-        self.virtual_bodies = []
+        # Simulated time and number of steps taken
+        self.time = 0.0
+        self.n_steps = 0
+
+        # Records every step to disk while set
+        self.recorder: Optional[TrajectoryRecorder] = None
+
+        # Time integration scheme of the simulation and the predictions
+        self.integrator: Integrator = get_integrator(OrbitSettings.INTEGRATOR)
+
+        # Individual steps per body for the simulation, used instead of the integrator when BLOCK_TIMESTEPS is on
+        self.block_timesteps = BlockTimesteps()
+
+        # Prediction: cached future of the bodies (store version, ephemeris) and the latest completed prediction
+        self.ephemeris_cache: Optional[tuple[int, Ephemeris]] = None
+        self.prediction: Optional[Prediction] = None
+
+        # Background worker for predictions, created on first use
+        self.predictor: Optional[AsyncPredictor] = None
+
+    @property
+    def bodies(self) -> list[CelestialBody]:
+        """Handles of the simulated bodies in slot order."""
+        return self.store.handles
 
     def get_sun(self):
         return self.bodies[0]
 
-    def physics_step(self, dt, bodies, n_body_sim: bool = True):
+    @staticmethod
+    def accelerations(positions: np.ndarray, masses: np.ndarray, n_body_sim: bool = True) -> np.ndarray:
+        """Gravitational acceleration of each body. The sun is the first body."""
         if n_body_sim:
-            # Dynamics: Calculate gravitational accelerations for each pair of the bodies
-            for (a, b) in itertools.combinations(bodies, 2):
+            # Dynamics: Approximate the far field with a quadtree
+            if OrbitSettings.GRAVITY_BACKEND == "barnes_hut":
+                return barnes_hut_accelerations(positions, masses, theta=OrbitSettings.BARNES_HUT_THETA)
 
-                # Relative position
-                F = CelestialBody.gravitational_force(a, b)
+            # Dynamics: Calculate gravitational accelerations for all pairs of the bodies at once
+            return direct_accelerations(positions, masses)
 
-                # Update velocities using the acceleration
-                a.velocity += F / a.mass * dt
-                b.velocity += -F / b.mass * dt
-        else:
-            # Dynamics: Calculate the graviational aceleration for each body:
-            for b in bodies[1:]:
-                F = CelestialBody.gravitational_force(b, self.get_sun())
-                b.velocity += F / b.mass * dt
+        # Dynamics: Calculate the graviational aceleration for each body due to the sun:
+        acc = np.zeros_like(positions)
+        acc[1:] = central_accelerations(positions[1:], positions[0], masses[0])
+        return acc
+
+    @profiled("physics")
+    def physics_step(self, dt, store: BodyStore, n_body_sim: bool = True):
+        masses = store.masses
+
+        # Save position to the position history, at a fixed rate in simulated time
+        store.sample_history(self.time)
 
-        for idx, body in enumerate(bodies):
-            # Save position to object's position history
-            body.history.append(tuple(body.position))
+        if OrbitSettings.BLOCK_TIMESTEPS:
+            self.block_timesteps.step(store, dt, n_body_sim)
+            return
 
-            # Update position
-            body.position += body.velocity * dt
+        # Update positions and velocities with the integrator
+        self.integrator.step(
+            0.0, store.positions, store.velocities, dt, lambda t, positions: self.accelerations(positions, masses, n_body_sim)
+        )
+        store.touch()
 
+    @profiled("destruction_check")
     def destruction_check(self, screen_size: Vector):
-        for idx, body in enumerate(self.bodies):
+        """Remove the bodies that are far away from the viewport or too close to the sun, all at once.
+        The bodies that hit the sun and the ones that escaped are reported to the destruction callback, as one batch of
+        (pos, vel, col) events of each kind.
+        """
+        positions, sizes = self.store.positions, self.store.sizes
+        width, height = map(float, screen_size)
+
+        # Objects that are too far away
+        extent = np.abs(positions)
+        too_far = (extent[:, 0] > 2 * width) & (extent[:, 1] > 2 * height)
+
+        # Objects that fly too close to the sun (squared distances, no square root per body)
+        offset = positions - positions[0]
+        reach = sizes + (sizes[0] + OrbitSettings.SUN_DESTRUCTION_RANGE)
+        too_close = np.einsum("ij,ij->i", offset, offset) < reach * reach
 
-            # Delete objects that are too far away
-            if body.is_too_far_away(screen_size):
-                print(f"Deleting body too far away at position: {body.position}.")
-                del self.bodies[idx]
+        # The sun itself stays in the first slot
+        to_delete = too_far | too_close
+        to_delete[0] = False
+        if not np.count_nonzero(to_delete):
+            return
 
-            # Delete objects that fly too close to the sun
-            if body.is_too_close_to_sun(self.get_sun()):
-                print(f"Deleting body too close to Sun.")
-                self.destruction_callback(body.position, body.velocity, body.color)
-                del self.bodies[idx]
+        too_close[0] = False
+        hits, escapes = np.flatnonzero(too_close), np.flatnonzero(to_delete & ~too_close)
+        if len(hits):
+            self.destruction_callback(self.destruction_events(hits), SUN_IMPACT)
+        if len(escapes):
+            self.destruction_callback(self.destruction_events(escapes), ESCAPED)
 
+        self.store.remove(np.flatnonzero(to_delete))
+
+    @profiled("collision_check")
+    def collision_check(self):
+        """Merge the bodies that touch each other into one body per group, conserving mass and momentum.
+        The merged body takes the lowest slot of its group (the sun when it is involved) and the color of the heaviest one.
+        Each merge is reported to the destruction callback as a MERGED event of the merged body, in one batch.
+        """
+        store = self.store
+        n = len(store)
+        pairs = collision_pairs(store.positions, store.sizes)
+        if not len(pairs):
+            return
+
+        positions, velocities, masses, sizes, colors = store.positions, store.velocities, store.masses, store.sizes, store.colors
+        labels = group_labels(pairs, n)
+        merged = np.unique(labels[pairs[:, 0]])
+
+        def group_sum(weights):
+            return np.bincount(labels, weights=weights, minlength=n)[merged]
+
+        # Mass weighted position and velocity, so the momentum is conserved
+        total = group_sum(masses)
+        for axis in range(2):
+            positions[merged, axis] = group_sum(masses * positions[:, axis]) / total
+            velocities[merged, axis] = group_sum(masses * velocities[:, axis]) / total
+
+        # Color of the heaviest body of each group
+        order = np.lexsort((-masses, labels))
+        sorted_labels = labels[order]
+        first = np.r_[True, sorted_labels[1:] != sorted_labels[:-1]]
+        heaviest = np.empty(n, dtype=np.intp)
+        heaviest[sorted_labels[first]] = order[first]
+        colors[merged] = colors[heaviest[merged]]
+
+        # The merged body covers the area of its parts
+        sizes[merged] = np.sqrt(group_sum(sizes ** 2))
+        masses[merged] = total
+
+        self.destruction_callback(self.destruction_events(merged), MERGED)
+        store.remove(np.flatnonzero(labels != np.arange(n)))
+
+    def destruction_events(self, slots) -> list[tuple]:
+        """(pos, vel, col) of the bodies in slots, copied so they outlive the removal."""
+        store = self.store
+        return [(store.positions[i].copy(), store.velocities[i].copy(), tuple(int(c) for c in store.colors[i])) for i in slots]
+
+    @profiled("step")
     def step(self, dt: float, screen_size: Vector):
         self.physics_step(
-            dt, self.bodies, n_body_sim=OrbitSettings.N_BODY_SIM
+            dt, self.store, n_body_sim=OrbitSettings.N_BODY_SIM
         )
         self.destruction_check(screen_size)
 
+        if OrbitSettings.COLLISIONS:
+            self.collision_check()
+
+        self.time += dt
+        self.n_steps += 1
+        if self.recorder is not None:
+            self.recorder.record(self.n_steps, self.time, self.store)
+
+    def start_recording(self, path) -> TrajectoryRecorder:
+        """Record every step into a recording directory, starting with the current state."""
+        self.stop_recording()
+        self.recorder = TrajectoryRecorder(path)
+        self.recorder.record(self.n_steps, self.time, self.store)
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def close(self):
+        """Finish the recording and stop the prediction worker, e.g. before exiting."""
+        self.stop_recording()
+        if self.predictor is not None:
+            self.predictor.shutdown()
+            self.predictor = None
+
+    def cached_ephemeris(self) -> Optional[Ephemeris]:
+        """The cached ephemeris if it is still valid for the current bodies."""
+        cache = self.ephemeris_cache
+        if cache is not None and cache[0] == self.store.version:
+            return cache[1]
+
+    def get_ephemeris(self) -> Ephemeris:
+        """Future states of the bodies (FUTURE_LENGTH + 1 samples) without any new body.
+        Cached until a body is added, removed or moved.
+        """
+        ephemeris = self.cached_ephemeris()
+        if ephemeris is None:
+            ephemeris = self.compute_ephemeris(self.store.positions, self.store.velocities, self.store.masses)
+            self.ephemeris_cache = (self.store.version, ephemeris)
+
+        return ephemeris
+
+    def compute_ephemeris(
+        self, positions: np.ndarray, velocities: np.ndarray, masses: np.ndarray, cancelled: Optional[Callable[[], bool]] = None
+    ) -> Ephemeris:
+        """Integrate copies of the body states for FUTURE_LENGTH prediction steps."""
+        positions, velocities = positions.copy(), velocities.copy()
+        ephemeris = Ephemeris(
+            positions=np.empty((OrbitSettings.FUTURE_LENGTH + 1, *positions.shape)),
+            velocities=np.empty((OrbitSettings.FUTURE_LENGTH + 1, *velocities.shape)),
+            dt=OrbitSettings.PREDICTION_DT,
+        )
+
+        def acceleration(t, x):
+            return self.accelerations(x, masses, OrbitSettings.N_BODY_PRED)
+
+        for k in range(OrbitSettings.FUTURE_LENGTH + 1):
+            if k % 32 == 0:
+                raise_if(cancelled)
+
+            ephemeris.positions[k] = positions
+            ephemeris.velocities[k] = velocities
+            if k < OrbitSettings.FUTURE_LENGTH:
+                self.integrator.step(k * ephemeris.dt, positions, velocities, ephemeris.dt, acceleration)
+
+        return ephemeris
+
+    def integrate_test_body(
+        self, position: Vector, velocity: Vector, ephemeris: Ephemeris, masses: np.ndarray, cancelled: Optional[Callable[[], bool]] = None
+    ) -> np.ndarray:
+        """Trajectory (FUTURE_LENGTH, 2) of a massless body moving in the field of the bodies given by the ephemeris."""
+        return self.integrate_test_bodies(np.array([position]), np.array([velocity]), ephemeris, masses, cancelled)[0]
+
+    def integrate_test_bodies(
+        self, positions: np.ndarray, velocities: np.ndarray, ephemeris: Ephemeris, masses: np.ndarray,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> np.ndarray:
+        """Trajectories (K, FUTURE_LENGTH, 2) of K massless bodies, integrated together as one (K, 2) state.
+        The bodies do not pull on each other, so each step costs about the same as for a single body.
+        """
+        x = np.array(positions, dtype=np.float64).reshape(-1, 2)
+        v = np.array(velocities, dtype=np.float64).reshape(-1, 2)
+        paths = np.empty((len(x), OrbitSettings.FUTURE_LENGTH, 2))
+        dt = ephemeris.dt
+
+        if OrbitSettings.N_BODY_PRED:
+            def acceleration(t, points):
+                return field_accelerations(points, ephemeris.at(t), masses)
+
+        else:
+            # Only the sun pulls on the bodies: the single source needs no (K, N) interaction matrix
+            sun, sun_mass = ephemeris[:1], masses[0]
+
+            def acceleration(t, points):
+                return central_accelerations(points, sun.at(t)[0], sun_mass)
+
+        for k in range(OrbitSettings.FUTURE_LENGTH):
+            if k % 32 == 0:
+                raise_if(cancelled)
+
+            paths[:, k] = x
+            self.integrator.step(k * dt, x, v, dt, acceleration)
+
+        return paths
+
+    def predict_launch(
+        self, position: Vector, velocity: Vector, ephemeris: Ephemeris, masses: np.ndarray, cancelled: Optional[Callable[[], bool]] = None
+    ) -> Prediction:
+        """Prediction of a launch and, when AIM_FAN is on, of the aim fan around it, all integrated in one batch."""
+        velocities = np.array([velocity], dtype=np.float64)
+        if OrbitSettings.AIM_FAN:
+            velocities = np.concatenate([velocities, aim_fan(velocity)])
+
+        positions = np.broadcast_to(np.asarray(position, dtype=np.float64), velocities.shape)
+        paths = self.integrate_test_bodies(positions, velocities, ephemeris, masses, cancelled)
+        return Prediction(ephemeris.positions, paths[0], fan=paths[1:] if OrbitSettings.AIM_FAN else None)
+
+    @profiled("predict")
     def predict(self, position: Vector, velocity: Vector):
-        """Predict the future if a new planet with state appered."""
+        """Predict the future if a new planet with state appered.
+        Only the new body is integrated, the future of the existing bodies comes from the cached ephemeris.
+        """
+        ephemeris = self.get_ephemeris()
+        self.prediction = self.predict_launch(position, velocity, ephemeris, self.store.masses)
 
-        newBody = CelestialBody(position, velocity, color=color.CYAN)
-        self.virtual_bodies = deepcopy(self.bodies)
-        self.virtual_bodies.append(newBody)
+    def predict_async(self, position: Vector, velocity: Vector):
+        """Same as predict, but runs on a background worker. draw_futures shows the latest completed prediction."""
+        if self.predictor is None:
+            self.predictor = AsyncPredictor(self)
 
-        for b in self.virtual_bodies:
-            b.virtual = True
+        self.predictor.submit(position, velocity)
 
-        for i in range(OrbitSettings.FUTURE_LENGTH):
-            self.physics_step(
-                OrbitSettings.PREDICTION_DT,
-                self.virtual_bodies,
-                n_body_sim=OrbitSettings.N_BODY_PRED,
-            )
+    def snapshot(self) -> Snapshot:
+        """State of the bodies and their histories. The arrays are views, write them out before the next step."""
+        return Snapshot(
+            arrays={f"bodies/{name}": array for name, array in self.store.state().items()},
+            meta=dict(
+                n_bodies=len(self.store),
+                time=self.time,
+                n_steps=self.n_steps,
+                integrator=self.integrator.name,
+            ),
+        )
+
+    def restore(self, snapshot: Snapshot):
+        """Replace the bodies with the ones of a snapshot. Pending and cached predictions are dropped."""
+        arrays = {name.removeprefix("bodies/"): array for name, array in snapshot.arrays.items() if name.startswith("bodies/")}
+        self.store = BodyStore.from_state(arrays)
+        self.time = snapshot.meta.get("time", 0.0)
+        self.n_steps = snapshot.meta.get("n_steps", 0)
+        self.ephemeris_cache = None
+        self.clear_futures()
 
     def clear_histories(self):
         """Clear the history of each planet due to screen size change."""
-        [body.clear_history() for body in self.bodies]
+        self.store.clear_history()
 
     def clear_futures(self):
-        self.virtual_bodies = []
-
-    def draw_bodies(self):
-        """Draw a filled circle onto the screen for each celestial body."""
-        for body in self.bodies:
-            screen_position = body.position
-            arcade.draw_circle_filled(
-                *screen_position, radius=body.size, color=body.color
-            )
-
-    def draw_histories(self):
-        for body in self.bodies:
-            if body.history:
-                arcade.draw_points(body.history, color=Color.HISTORY_COLOR)
-
-    def draw_futures(self):
-        for body in self.virtual_bodies:
-            if body.history:
-                arcade.draw_points(body.history, color=Color.PREDICTION_COLOR)
+        if self.predictor is not None:
+            self.predictor.cancel()
+
+        self.prediction = None
 
     def delete_latest_body(self):
         b = self.bodies[-1]
         if b is not self.get_sun():
             print("CTRL + D: Deleting last celestial body")
-            self.destruction_callback(b.position, b.velocity, b.color)
-            self.bodies[-1].clear_history()
-            del self.bodies[-1]
+            self.destruction_callback(self.destruction_events([b.slot]), DELETED)
+            self.store.remove([b.slot])
 
     def add_body(self, *args, **kwargs):
         newCelestialBody = CelestialBody(*args, **kwargs)
-        self.bodies.append(newCelestialBody)
+        self.store.adopt(newCelestialBody)
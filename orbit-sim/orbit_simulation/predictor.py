@@ -0,0 +1,149 @@
+from __future__ import annotations
+import threading
+import numpy as np
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Optional
+from utils import Vector
+from settings import OrbitSettings
+from profiling import profiled
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from orbit_simulation.ephemeris import Ephemeris
+    from orbit_simulation.orbit_simulator import OrbitSimulator
+
+
+class PredictionCancelled(Exception):
+    pass
+
+
+@dataclass
+class Prediction:
+    """Result of a trajectory prediction."""
+
+    # Future positions of the existing bodies (steps, N, 2)
+    ephemeris: np.ndarray
+
+    # Trajectory of the new body (steps, 2)
+    future: np.ndarray
+
+    # Trajectories of the aim fan: launches around the new body's velocity (K, steps, 2)
+    fan: Optional[np.ndarray] = None
+
+
+def aim_fan(
+    velocity: Vector, angle: float = OrbitSettings.AIM_FAN_ANGLE, n_angles: int = OrbitSettings.AIM_FAN_ANGLES,
+    speed: float = OrbitSettings.AIM_FAN_SPEED, n_speeds: int = OrbitSettings.AIM_FAN_SPEEDS,
+) -> np.ndarray:
+    """Launch velocities (K, 2) around velocity: every combination of n_angles directions within +-angle degrees
+    and n_speeds speeds within a relative +-speed. The velocity itself is left out.
+    """
+    angles = np.radians(np.linspace(-angle, angle, n_angles))
+    scales = np.linspace(1.0 - speed, 1.0 + speed, n_speeds)
+    angles, scales = (grid.ravel() for grid in np.meshgrid(angles, scales, indexing="ij"))
+
+    keep = ~np.isclose(angles, 0.0) | ~np.isclose(scales, 1.0)
+    angles, scales = angles[keep], scales[keep]
+
+    # Rotate and scale the velocity for all candidates at once
+    vx, vy = np.asarray(velocity, dtype=np.float64)
+    ca, sa = np.cos(angles) * scales, np.sin(angles) * scales
+    return np.stack([ca * vx - sa * vy, sa * vx + ca * vy], axis=1)
+
+
+def raise_if(cancelled: Optional[Callable[[], bool]]) -> None:
+    """Cooperative cancellation point for long running predictions."""
+    if cancelled is not None and cancelled():
+        raise PredictionCancelled
+
+
+class AsyncPredictor:
+    """Runs the trajectory predictions of an OrbitSimulator on a background worker.
+    A new request replaces the pending one, while the running one finishes and publishes its result: when requests come
+    in faster than a prediction takes (e.g. every frame while dragging), the shown prediction still follows the mouse.
+    The ephemeris only depends on the bodies, so it is computed once per store version and reused by the requests that
+    follow. Running work is only cancelled when the bodies change or the predictions are cleared.
+    """
+
+    def __init__(self, orbit_simulator: OrbitSimulator):
+        # Imported on first use: concurrent.futures pulls in logging, which slows down importing the core
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.orbit_simulator = orbit_simulator
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predictor")
+
+        # Cancellations are numbered, a result is stale when the predictions were cleared after its request
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pending: Optional[Future] = None
+
+        # Store version of the latest request, an ephemeris of another version is no longer needed
+        self.version: Optional[int] = None
+
+    def submit(self, position: Vector, velocity: Vector) -> None:
+        sim = self.orbit_simulator
+        version = sim.store.version
+        with self.lock:
+            self.version = version
+            generation = self.generation
+
+        self.drop_pending()
+
+        # The worker must not read the live body arrays: hand over a copy of the state unless the ephemeris is cached
+        state = None if sim.cached_ephemeris() is not None else (sim.store.positions.copy(), sim.store.velocities.copy())
+        masses = sim.store.masses.copy()
+
+        self.pending = self.executor.submit(self.run, generation, version, position, velocity, state, masses)
+
+    def cancel(self) -> None:
+        """Invalidate the current request and the ephemeris in progress. Running work stops at its next cancellation point."""
+        with self.lock:
+            self.generation += 1
+            self.version = None
+
+        self.drop_pending()
+
+    def drop_pending(self) -> None:
+        """Drop the request that has not started yet."""
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+
+    def ephemeris(self, version: int, state, masses: np.ndarray) -> Ephemeris:
+        """The ephemeris of the given store version: cached by an earlier request, or computed and cached now."""
+        sim = self.orbit_simulator
+        cache = sim.ephemeris_cache
+        if cache is not None and cache[0] == version:
+            return cache[1]
+
+        if state is None:
+            # The cached ephemeris was dropped since the request: the bodies changed
+            raise PredictionCancelled
+
+        ephemeris = sim.compute_ephemeris(*state, masses, cancelled=lambda: version != self.version)
+        sim.ephemeris_cache = (version, ephemeris)
+        return ephemeris
+
+    @profiled("predict_async")
+    def run(self, generation, version, position, velocity, state, masses) -> None:
+        sim = self.orbit_simulator
+
+        def cancelled():
+            return generation != self.generation
+
+        try:
+            ephemeris = self.ephemeris(version, state, masses)
+            prediction = sim.predict_launch(position, velocity, ephemeris, masses, cancelled=cancelled)
+
+        except PredictionCancelled:
+            return
+
+        # Publish unless the predictions were cleared meanwhile
+        with self.lock:
+            if not cancelled():
+                sim.prediction = prediction
+
+    def shutdown(self) -> None:
+        """Cancel the requests and stop the worker. A running prediction stops at its next cancellation point."""
+        self.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
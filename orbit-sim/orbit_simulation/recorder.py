@@ -0,0 +1,213 @@
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from orbit_simulation.body_store import BodyStore
+from settings import OrbitSettings
+
+# A recording is a directory of append-only files:
+#   meta.json   format version and record layouts
+#   bodies.bin  one BODY_DTYPE record per body and step, the steps one after another
+#   steps.bin   one STEP_DTYPE record per step: where its bodies are in bodies.bin
+#   keyframes.bin  index of the first step at or after every keyframe interval of simulated time (int64)
+# Bodies are identified by their id, so bodies added or removed during the run are followed across steps.
+RECORDING_VERSION = 1
+
+BODY_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("position", "<f8", (2,)),
+    ("velocity", "<f8", (2,)),
+    ("mass", "<f8"),
+    ("size", "<f4"),
+    ("color", "u1", (3,)),
+])
+
+STEP_DTYPE = np.dtype([
+    ("step", "<i8"),
+    ("time", "<f8"),
+    ("offset", "<i8"),
+    ("count", "<i8"),
+])
+
+
+class TrajectoryRecorder:
+    """Appends the state of every step to a recording on disk.
+    Steps are collected in an in-memory buffer. Full buffers are handed to a background thread that writes
+    them to the end of the files, so the simulation only pays for copying the body arrays.
+    """
+
+    def __init__(
+        self, path: str | Path, buffer_steps: int = OrbitSettings.RECORD_BUFFER_STEPS,
+        keyframe_interval: float = OrbitSettings.RECORD_KEYFRAME_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / "meta.json").write_text(json.dumps(dict(
+            version=RECORDING_VERSION,
+            body_dtype=BODY_DTYPE.descr,
+            step_dtype=STEP_DTYPE.descr,
+            keyframe_interval=keyframe_interval,
+        ), indent=2))
+
+        self.bodies_file = open(self.path / "bodies.bin", "wb")
+        self.steps_file = open(self.path / "steps.bin", "wb")
+        self.keyframes_file = open(self.path / "keyframes.bin", "wb")
+
+        # Keyframes: the first step at or after each multiple of the interval since the first step
+        self.keyframe_interval = keyframe_interval
+        self.next_keyframe: Optional[float] = None
+        self.keyframes: list[int] = []
+
+        # Write buffer: body records and step records of the steps not yet handed to the writer
+        self.buffer_steps = buffer_steps
+        self.bodies = np.empty(1024, dtype=BODY_DTYPE)
+        self.steps = np.empty(buffer_steps, dtype=STEP_DTYPE)
+        self.n_bodies = 0
+        self.n_steps = 0
+
+        # Totals over the whole recording
+        self.total_steps = 0
+        self.total_bodies = 0
+
+        # Background writer, the queue is bounded so a slow disk slows down the recording instead of filling the memory
+        self.queue: queue.Queue = queue.Queue(maxsize=OrbitSettings.RECORD_QUEUE_CHUNKS)
+        self.error: Optional[BaseException] = None
+        self.writer = threading.Thread(target=self.write_chunks, name="recorder", daemon=True)
+        self.writer.start()
+
+    def record(self, step: int, time: float, store: BodyStore) -> None:
+        """Append the current state of the bodies in the store."""
+        if self.error is not None:
+            raise self.error
+
+        n = len(store)
+        if self.n_bodies + n > len(self.bodies):
+            bodies = np.empty(max(2 * len(self.bodies), self.n_bodies + n), dtype=BODY_DTYPE)
+            bodies[:self.n_bodies] = self.bodies[:self.n_bodies]
+            self.bodies = bodies
+
+        rows = self.bodies[self.n_bodies:self.n_bodies + n]
+        rows["id"] = store.ids
+        rows["position"] = store.positions
+        rows["velocity"] = store.velocities
+        rows["mass"] = store.masses
+        rows["size"] = store.sizes
+        rows["color"] = store.colors
+
+        self.steps[self.n_steps] = (step, time, self.total_bodies, n)
+
+        if self.next_keyframe is None:
+            self.next_keyframe = time
+        while time >= self.next_keyframe - 1e-9 * self.keyframe_interval:
+            self.keyframes.append(self.total_steps)
+            self.next_keyframe += self.keyframe_interval
+
+        self.n_bodies += n
+        self.n_steps += 1
+        self.total_bodies += n
+        self.total_steps += 1
+
+        if self.n_steps == self.buffer_steps:
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the buffered steps to the writer."""
+        if self.n_steps:
+            keyframes = np.array(self.keyframes, dtype=np.int64)
+            self.queue.put((self.bodies[:self.n_bodies].copy(), self.steps[:self.n_steps].copy(), keyframes))
+            self.n_bodies = self.n_steps = 0
+            self.keyframes = []
+
+    def write_chunks(self) -> None:
+        while (chunk := self.queue.get()) is not None:
+            try:
+                bodies, steps, keyframes = chunk
+
+                # Each file is flushed before the next one, so a reader never sees a step without its bodies
+                for file, data in ((self.bodies_file, bodies), (self.steps_file, steps), (self.keyframes_file, keyframes)):
+                    file.write(data.data)
+                    file.flush()
+            except BaseException as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def close(self) -> None:
+        """Write the remaining steps and close the files."""
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+        self.bodies_file.close()
+        self.steps_file.close()
+        self.keyframes_file.close()
+
+        if self.error is not None:
+            raise self.error
+
+
+class Recording:
+    """Read access to a recording. The files are memory-mapped: only the steps that are read are loaded."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text())
+        if meta["version"] > RECORDING_VERSION:
+            raise ValueError(f"{path} has recording format version {meta['version']}, this version reads up to {RECORDING_VERSION}.")
+
+        self.bodies = self.map(self.path / "bodies.bin", BODY_DTYPE)
+        self.steps = self.map(self.path / "steps.bin", STEP_DTYPE)
+
+        # Keyframe index for seeking, only keyframes of steps that are already written
+        self.keyframe_interval = meta.get("keyframe_interval", 1.0)
+        keyframes = self.map(self.path / "keyframes.bin", np.dtype("<i8")) if (self.path / "keyframes.bin").exists() else np.empty(0, np.int64)
+        self.keyframes = keyframes[:np.searchsorted(keyframes, len(self.steps))]
+
+    @staticmethod
+    def map(path: Path, dtype: np.dtype) -> np.ndarray:
+        # Only whole records, the writer may be in the middle of appending
+        count = path.stat().st_size // dtype.itemsize
+        if not count:
+            return np.empty(0, dtype=dtype)
+
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    @property
+    def start_time(self) -> float:
+        return float(self.steps[0]["time"]) if len(self) else 0.0
+
+    @property
+    def end_time(self) -> float:
+        return float(self.steps[-1]["time"]) if len(self) else 0.0
+
+    def find(self, time: float) -> int:
+        """Index of the last step at or before time (the first step before the start).
+        The keyframe of the time narrows the search to the steps of one keyframe interval, so seeking takes
+        the same time anywhere in a recording of any length.
+        """
+        if not len(self) or time < self.start_time:
+            return 0
+
+        k = int((time - self.start_time) // self.keyframe_interval)
+        if k + 1 < len(self.keyframes):
+            # Between the step before keyframe k and keyframe k + 1
+            lo, hi = max(int(self.keyframes[k]) - 1, 0), int(self.keyframes[k + 1]) + 1
+        else:
+            # After the last keyframe: less than one interval of steps in a finished recording
+            lo, hi = (max(int(self.keyframes[-1]) - 1, 0) if len(self.keyframes) else 0), len(self)
+
+        times = self.steps["time"][lo:hi]
+        return lo + max(int(np.searchsorted(times, time, side="right")) - 1, 0)
+
+    def frame(self, k: int) -> np.ndarray:
+        """Body records (count,) of the k-th recorded step."""
+        step = self.steps[k]
+        return self.bodies[step["offset"]:step["offset"] + step["count"]]
+
+    def trajectory(self, body_id: int) -> np.ndarray:
+        """Body records of one body over all the steps it was alive in."""
+        return self.bodies[self.bodies["id"] == body_id]
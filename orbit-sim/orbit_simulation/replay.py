@@ -0,0 +1,68 @@
+from orbit_simulation.body_store import BodyStore
+from orbit_simulation.recorder import Recording
+
+
+class ReplayPlayer:
+    """Plays back a recording into a body store instead of running the physics.
+    The playhead is a simulated time. Each frame the step at the playhead is read from the memory-mapped
+    recording, so only the displayed steps are loaded, and seeking to any time is a keyframe lookup.
+    """
+
+    def __init__(self, recording: Recording):
+        self.recording = recording
+        self.store = BodyStore()
+
+        # Playhead and the index of the step it shows
+        self.time = recording.start_time
+        self.index = -1
+        self.playing = True
+        self.speed = 1.0
+
+        self.seek(self.time)
+
+    @property
+    def duration(self) -> float:
+        return self.recording.end_time - self.recording.start_time
+
+    @property
+    def progress(self) -> float:
+        """Position of the playhead in [0, 1]."""
+        return (self.time - self.recording.start_time) / self.duration if self.duration > 0 else 1.0
+
+    def seek(self, time: float) -> None:
+        """Move the playhead. The trails restart from the new position."""
+        self.time = min(max(time, self.recording.start_time), self.recording.end_time)
+        self.show(self.recording.find(self.time), continuous=False)
+
+    def seek_progress(self, progress: float) -> None:
+        self.seek(self.recording.start_time + progress * self.duration)
+
+    def advance(self, dt: float) -> None:
+        """Move the playhead forward by dt real seconds (times the playback speed) when playing."""
+        if not self.playing:
+            return
+
+        self.time = min(self.time + dt * self.speed, self.recording.end_time)
+        index = self.recording.find(self.time)
+
+        # Show the steps in between as well when there are few of them, so the trails stay continuous
+        if 0 < index - self.index <= self.store.history_length:
+            for k in range(self.index + 1, index + 1):
+                self.show(k, continuous=True)
+        elif index != self.index:
+            self.show(index, continuous=False)
+
+        if self.time >= self.recording.end_time:
+            self.playing = False
+
+    def show(self, index: int, continuous: bool) -> None:
+        """Load the bodies of a recorded step into the store. A continuous step extends the trails."""
+        frame = self.recording.frame(index)
+        self.store.load_frame(
+            frame["id"], frame["position"], frame["velocity"], frame["mass"], frame["size"], frame["color"],
+        )
+
+        if not continuous:
+            self.store.clear_history()
+        self.store.sample_history(float(self.recording.steps[index]["time"]))
+        self.index = index
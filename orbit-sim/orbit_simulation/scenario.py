@@ -0,0 +1,39 @@
+import json
+from pathlib import Path
+from orbit_simulation.celestial_body import CelestialBody
+
+
+def load_scenario(path: str | Path) -> list[CelestialBody]:
+    """Load the initial bodies from a JSON scenario file. The first body is the sun.
+
+    {"bodies": [{"position": [0, 0], "velocity": [0, 0], "mass": 1e7, "size": 10, "color": [255, 200, 0]}, ...]}
+
+    Only position and velocity are required, the rest default to the CelestialBody defaults.
+    """
+    with open(path) as file:
+        scenario = json.load(file)
+
+    bodies = [CelestialBody(**body) for body in scenario["bodies"]]
+    if not bodies:
+        raise ValueError(f"Scenario {path} has no bodies.")
+
+    return bodies
+
+
+def save_scenario(path: str | Path, bodies: list[CelestialBody]) -> None:
+    """Write the state of the bodies into a JSON scenario file."""
+    scenario = {
+        "bodies": [
+            dict(
+                position=body.position.tolist(),
+                velocity=body.velocity.tolist(),
+                mass=body.mass,
+                size=body.size,
+                color=list(body.color),
+            )
+            for body in bodies
+        ]
+    }
+
+    with open(path, "w") as file:
+        json.dump(scenario, file, indent=2)
@@ -0,0 +1,77 @@
+import time
+from typing import Callable
+from settings import OrbitSettings
+
+
+class FixedStepScheduler:
+    """Runs the simulation in fixed steps of dt, independent of the frame rate.
+    Each frame adds its (warped) duration to an accumulator, and whole steps are taken from it.
+    The steps of a frame run in batches within a CPU time budget: when the budget or the step limit is
+    exceeded the remaining steps are dropped, so the simulation slows down instead of freezing the window.
+    Each batch is sized from the running average time of a step to fit in the budget that is left, so
+    expensive steps run one at a time. At least one step runs every frame.
+    """
+
+    def __init__(
+        self,
+        dt: float = OrbitSettings.FIXED_DT,
+        budget: float = OrbitSettings.STEP_BUDGET,
+        max_steps: int = OrbitSettings.MAX_STEPS_PER_FRAME,
+        batch: int = OrbitSettings.STEP_BATCH,
+    ):
+        self.dt = dt
+        self.budget = budget
+        self.max_steps = max_steps
+        self.batch = batch
+
+        # Simulated seconds per real second
+        self.warp = 1.0
+
+        # Simulated time that is due but not yet stepped (less than dt after each frame)
+        self.accumulator = 0.0
+
+        # Statistics: steps and simulated time of the last frame, steps dropped so far
+        self.frame_steps = 0
+        self.frame_time = 0.0
+        self.dropped_steps = 0
+
+        # Running average of the CPU time of a step [s], None until the first step
+        self.step_time = None
+
+    def set_warp(self, warp: float) -> None:
+        self.warp = min(max(warp, 1.0), OrbitSettings.TIME_WARP_MAX)
+
+    def advance(self, frame_dt: float, step: Callable[[float], None]) -> float:
+        """Call step(dt) for every fixed step due after a frame of frame_dt seconds.
+        Returns the simulated time of the frame.
+        """
+        # A long hitch (window drag, breakpoint) would queue up steps that never catch up
+        self.accumulator += min(frame_dt, OrbitSettings.MAX_FRAME_DT) * self.warp
+
+        due = int(self.accumulator / self.dt)
+        limit = min(due, self.max_steps)
+        deadline = time.perf_counter() + self.budget
+
+        steps = 0
+        while steps < limit:
+            # The first step alone measures the step time, then as many steps as the rest of the budget fits
+            start = time.perf_counter()
+            fits = 1 if self.step_time is None else int((deadline - start) / max(self.step_time, 1e-9))
+            if steps and fits < 1:
+                break
+
+            batch = min(max(fits, 1), self.batch, limit - steps)
+            for _ in range(batch):
+                step(self.dt)
+            steps += batch
+
+            elapsed = (time.perf_counter() - start) / batch
+            self.step_time = elapsed if self.step_time is None else 0.8 * self.step_time + 0.2 * elapsed
+
+        # Drop the steps that did not fit in the budget
+        self.dropped_steps += due - steps
+        self.accumulator -= due * self.dt
+
+        self.frame_steps = steps
+        self.frame_time = steps * self.dt
+        return self.frame_time
@@ -0,0 +1,100 @@
+import json
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
+
+# File layout:
+#   magic (8 bytes) | format version (uint32) | header length (uint32) | JSON header | arrays
+# The header lists each array with its dtype, shape and byte offset. Arrays start at ALIGNMENT byte boundaries,
+# so they are read as memory-mapped views without copying or parsing.
+SNAPSHOT_MAGIC = b"ORBITSNP"
+SNAPSHOT_VERSION = 2
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sII")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+@dataclass
+class Snapshot:
+    """Named arrays and metadata of a saved simulation state.
+    Read from a file the arrays are read-only memory-mapped views: their pages are loaded on first access.
+    """
+
+    arrays: dict[str, np.ndarray] = field(default_factory=dict)
+    meta: dict = field(default_factory=dict)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.arrays
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(path: str | Path, snapshot: Snapshot) -> None:
+    """Write the arrays and metadata of the snapshot into a file."""
+    arrays = {name: np.ascontiguousarray(array) for name, array in snapshot.arrays.items()}
+
+    # Array offsets relative to the start of the data section
+    entries, offset = {}, 0
+    for name, array in arrays.items():
+        entries[name] = dict(dtype=array.dtype.str, shape=list(array.shape), offset=offset)
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps(dict(meta=snapshot.meta, arrays=entries)).encode()
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    with open(path, "wb") as file:
+        file.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+        file.write(header)
+        for name, array in arrays.items():
+            file.seek(data_start + entries[name]["offset"])
+            file.write(array.data)
+
+
+def read_snapshot(path: str | Path) -> Snapshot:
+    """Open a snapshot file. Only the header is parsed, the arrays are memory-mapped."""
+    with open(path, "rb") as file:
+        preamble = file.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            raise SnapshotError(f"{path} is not a snapshot file.")
+
+        magic, version, header_length = _PREAMBLE.unpack(preamble)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot file.")
+        if version > SNAPSHOT_VERSION:
+            raise SnapshotError(f"{path} has snapshot format version {version}, this version reads up to {SNAPSHOT_VERSION}.")
+
+        header = json.loads(file.read(header_length))
+
+    data_start = _align(_PREAMBLE.size + header_length)
+    buffer = np.memmap(path, mode="r")
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype, shape = np.dtype(entry["dtype"]), tuple(entry["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=dtype)
+            continue
+
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=data_start + entry["offset"])
+
+    return _migrate(Snapshot(arrays=arrays, meta=header["meta"]), version)
+
+
+def _migrate(snapshot: Snapshot, version: int) -> Snapshot:
+    """Bring a snapshot of an older format version up to SNAPSHOT_VERSION."""
+    # Version 2: each body has its own history ring head, version 1 had one head for all bodies in the metadata
+    if version < 2 and "bodies/history_count" in snapshot:
+        n = len(snapshot["bodies/history_count"])
+        snapshot.arrays["bodies/history_head"] = np.full(n, snapshot.meta.pop("history_head", 0), dtype=np.int64)
+
+    return snapshot
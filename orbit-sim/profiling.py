@@ -0,0 +1,129 @@
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from settings import AppSettings
+
+
+class FrameProfiler:
+    """Collects the time spent in named spans of code, per frame.
+    Spans that run several times in a frame (e.g. the fixed steps) are summed. The frames are kept in a ring buffer
+    with one column per span name, so the statistics are computed over the latest frames.
+    """
+
+    def __init__(self, n_frames: int = AppSettings.PROFILE_FRAMES):
+        self.enabled = True
+
+        # Span name -> column, in the order the spans first ran
+        self.columns: dict[str, int] = {}
+
+        # Ring buffer of the span times [s] of the latest frames, and the times of the running frame
+        self.times = np.zeros((n_frames, 0))
+        self.current: dict[str, float] = {}
+        self.n_frames = 0
+
+        # Spans may end on the prediction worker thread
+        self.lock = threading.Lock()
+        self.frame_start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str):
+        """Time the block of code in a with statement."""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def end_frame(self) -> None:
+        """Close the running frame: its span times and the total frame time are stored in the ring buffer."""
+        now = time.perf_counter()
+        self.add("total", now - self.frame_start)
+        self.frame_start = now
+
+        with self.lock:
+            current, self.current = self.current, {}
+
+        for name in current:
+            if name not in self.columns:
+                self.columns[name] = len(self.columns)
+                self.times = np.pad(self.times, ((0, 0), (0, 1)))
+
+        row = self.times[self.n_frames % len(self.times)]
+        row[:] = 0.0
+        for name, seconds in current.items():
+            row[self.columns[name]] = seconds
+        self.n_frames += 1
+
+    def frames(self) -> np.ndarray:
+        """Span times of the stored frames (frames, spans), oldest first."""
+        n = min(self.n_frames, len(self.times))
+        return np.roll(self.times, -self.n_frames, axis=0)[-n:] if n else self.times[:0]
+
+    def stats(self) -> dict[str, tuple[float, float, float]]:
+        """Mean, 95th percentile and maximum time [s] of each span over the stored frames."""
+        frames = self.frames()
+        if not len(frames):
+            return {}
+
+        mean, p95, peak = frames.mean(axis=0), np.percentile(frames, 95, axis=0), frames.max(axis=0)
+        return {name: (mean[i], p95[i], peak[i]) for name, i in self.columns.items()}
+
+    def export(self, path: str | Path) -> None:
+        """Write the span times [ms] of the stored frames to a .json file, or a .csv file for any other suffix."""
+        import csv
+        import json
+
+        path = Path(path)
+        frames = self.frames() * 1e3
+        names = list(self.columns)
+        first = self.n_frames - len(frames)
+
+        if path.suffix == ".json":
+            path.write_text(json.dumps(dict(
+                unit="ms",
+                frames=[dict(frame=first + k, **dict(zip(names, row.tolist()))) for k, row in enumerate(frames)],
+            ), indent=1))
+            return
+
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["frame"] + [f"{name} [ms]" for name in names])
+            for k, row in enumerate(frames):
+                writer.writerow([first + k] + [f"{value:.4f}" for value in row])
+
+
+# The profiler of the running program, spans of all modules are added to it
+PROFILER = FrameProfiler()
+
+
+def profiled(name: str):
+    """Decorator: time each call of the function as a span of PROFILER.
+    The decorated functions run every step, so the timing is inlined instead of going through the span generator.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.add(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
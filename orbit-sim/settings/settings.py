@@ -1,10 +1,10 @@
 from settings.immutable import Settings
-import arcade.color as color
 from pathlib import Path
 
-
-ASSETS = Path.cwd() / "assets"
-SHADERS = Path.cwd() / "orbit-sim" / "shaders"
+# Resources are found relative to the package, so the game starts from any working directory
+PACKAGE = Path(__file__).resolve().parent.parent
+ASSETS = PACKAGE.parent / "assets"
+SHADERS = PACKAGE / "shaders"
 
 class AppSettings(Settings):
     # Game Window
@@ -16,16 +16,29 @@ class AppSettings(Settings):
     ICON_16 = ASSETS / "icon16.png"
     ICON_32 = ASSETS / "icon32.png"
 
+    # OpenGL: 4.3 for compute shaders, the fallback context runs the particles on the CPU
+    GL_VERSION = (4, 3)
+    GL_VERSION_FALLBACK = (3, 3)
+
     # GUI
-    PLANET_COUNT_LOCATION = (20, 340)
-    PARTICLE_COUNT_LOCATION = (20, 320)
-    FPS_LOCATION = (20, 300)
-    INSTRUCTIONS_LOCATION = (20, 250)
+    CULL_COUNT_LOCATION = (20, 440)
+    TIME_WARP_LOCATION = (20, 420)
+    PLANET_COUNT_LOCATION = (20, 400)
+    PARTICLE_COUNT_LOCATION = (20, 380)
+    FPS_LOCATION = (20, 360)
+    INSTRUCTIONS_LOCATION = (20, 335)
+
+    # Replay timeline: bar along the bottom of the window (margin and height in pixels)
+    TIMELINE_MARGIN = 20
+    TIMELINE_HEIGHT = 8
+    TIMELINE_Y = 30
+
+    # Frame time breakdown: top left corner of the table and its line spacing
+    FRAME_TIMES_LOCATION = (480, 580)
+    FRAME_TIMES_Y_SEP = 16
+    SHOW_FRAME_TIMES = True
     INSTRUCTIONS_Y_SEP = 21 
 
-    # UX
-    DRAG_MOUSE_DELTA = 2
-
     # Instruction GUI
     INSTRUCTIONS = [
         "LMB: Drag & shoot planets",
@@ -35,12 +48,27 @@ class AppSettings(Settings):
         "D: Destroy last planet",
         "C: Clear particles",
         "P: Pause",
+        "LEFT / RIGHT: Slower / faster time warp",
+        "F5 / F9: Save / load snapshot",
+        "R: Start / stop recording",
+        "T: Export frame times",
         "F / ENTER: Toggle Fullscreen",
         "ESC / Q: Quit",
     ]
 
     SHOW_GUI = True
 
+    # Snapshots: F5 saves the scene into SNAPSHOT_FILE, F9 loads it. Particles are read back from the GPU when enabled
+    SNAPSHOT_FILE = Path.cwd() / "snapshot.orbit"
+    SNAPSHOT_PARTICLES = True
+
+    # Recordings: R starts and stops recording every step into a new directory in RECORDINGS_DIR
+    RECORDINGS_DIR = Path.cwd() / "recordings"
+
+    # Frame profiler: frames kept for the statistics, T exports them into PROFILE_FILE (.csv or .json)
+    PROFILE_FRAMES = 300
+    PROFILE_FILE = Path.cwd() / "frame_times.csv"
+
 
 class VFXSettings(Settings):
     PARTICLE_COUNT = 5000
@@ -53,31 +81,58 @@ class VFXSettings(Settings):
 
     WORLD2OPENGL_SPEED_SCALAR = 0.75
 
+    # Longest particle step [s], longer (time warped) frames are split into substeps
+    PARTICLE_MAX_DT = 1 / 60.0
+
     # Shaders
     COMPUTE_SHADER = SHADERS / "compute_shader.glsl"
     VERTEX_SHADER = SHADERS / "vertex_shader.glsl"
+    TRAIL_VERTEX_SHADER = SHADERS / "trail_vertex_shader.glsl"
     FRAGMENT_SHADER = SHADERS / "fragment_shader.glsl"
 
-    # Compute Shader
-    COMPUTE_SHADER_GROUP_COUNTS = (256, 1)
+    # Particle arena: number of bursts that fit in the preallocated buffers
+    PARTICLE_ARENA_SLOTS = 64
+
+    # Particle backend: "gpu" (compute shader, OpenGL 4.3), "cpu" (NumPy) or "auto" (gpu when available)
+    PARTICLE_BACKEND = "auto"
+
+    # Viewport culling: a grid index of cells of CULL_GRID_CELL pixels finds the bodies in view from CULL_GRID_MIN_BODIES bodies
+    CULL_GRID_MIN_BODIES = 5000
+    CULL_GRID_CELL = 100.0
+
+    # Compute Shader: invocations per work group
+    COMPUTE_SHADER_LOCAL_SIZE = (256, 1)
 
 
 class Color(Settings):
+    # RGB values of the arcade.color constants, so the settings do not import arcade
+
     # Window
     BACKGROUND_COLOR = (14, 14, 10)
 
     # UI
-    DRAG_COLOR = color.DARK_YELLOW
+    DRAG_COLOR = (155, 135, 12)  # DARK_YELLOW
 
     # Planets
-    EARTH_COLOR = color.BABY_BLUE
-    SUN_COLOR = color.CADMIUM_YELLOW
+    EARTH_COLOR = (137, 207, 240)  # BABY_BLUE
+    SUN_COLOR = (255, 246, 0)  # CADMIUM_YELLOW
     
     # History
-    HISTORY_COLOR = color.GRAY_BLUE
+    HISTORY_COLOR = (140, 146, 172)  # GRAY_BLUE
 
     # Prediction
-    PREDICTION_COLOR = color.LIGHT_CYAN
+    PREDICTION_COLOR = (224, 255, 255)  # LIGHT_CYAN
+    AIM_FAN_COLOR = (224, 255, 255)  # LIGHT_CYAN
+    AIM_FAN_ALPHA = 0.25
+
+    # Replay timeline
+    TIMELINE_COLOR = (140, 146, 172)  # GRAY_BLUE
+    TIMELINE_PROGRESS_COLOR = (224, 255, 255)  # LIGHT_CYAN
+
+    @staticmethod
+    def to_float(rgb, alpha: float = 1.0) -> tuple[float, float, float, float]:
+        """Convert an 8 bit RGB color to the [0, 1] RGBA color of the shaders."""
+        return rgb[0] / 255.0, rgb[1] / 255.0, rgb[2] / 255.0, alpha
 
 
 class OrbitSettings(Settings):
@@ -95,9 +150,76 @@ class OrbitSettings(Settings):
     EARTH_POSITION = [200, 0]
     EARTH_VELOCITY = [0, 280]
 
+    # Trails: positions are sampled every HISTORY_DT simulated seconds, and the points of nearly straight stretches are
+    # dropped while the trail strays at most HISTORY_TOLERANCE pixels. Each body keeps HISTORY_BUDGET bytes of points (8 each)
+    HISTORY_DT = 1 / 30.0
+    HISTORY_TOLERANCE = 1.0
+    HISTORY_BUDGET = 1024
+
     # Simulator settings
-    HISTORY_LENGTH = 700
     FUTURE_LENGTH = 700
     PREDICTION_DT = 1 / 15.0
     N_BODY_SIM = True
     N_BODY_PRED = False
+
+    # N-body gravity backend: "direct" (exact pairwise sum) or "barnes_hut" (quadtree approximation)
+    GRAVITY_BACKEND = "direct"
+    BARNES_HUT_THETA = 0.5
+    BARNES_HUT_MAX_DEPTH = 16
+
+    # Aim fan: faint predictions of launches around the dragged one, AIM_FAN_ANGLES directions within
+    # +-AIM_FAN_ANGLE degrees times AIM_FAN_SPEEDS speeds within a relative +-AIM_FAN_SPEED
+    AIM_FAN = True
+    AIM_FAN_ANGLE = 10.0
+    AIM_FAN_ANGLES = 5
+    AIM_FAN_SPEED = 0.1
+    AIM_FAN_SPEEDS = 3
+
+    # Bodies that touch each other merge into one
+    COLLISIONS = True
+
+    # Below this many bodies all pairs are tested for collisions instead of setting up a grid
+    COLLISION_GRID_MIN_BODIES = 64
+
+    # Fixed timestep: simulated seconds per step, and the CPU time per frame [s] the steps may take
+    FIXED_DT = 1 / 60.0
+    STEP_BUDGET = 0.010
+    MAX_STEPS_PER_FRAME = 512
+    MAX_FRAME_DT = 0.25
+
+    # Steps run between checks of the budget
+    STEP_BATCH = 8
+
+    # Time warp: simulated seconds per real second at most
+    TIME_WARP_MAX = 64
+
+    # Trajectory recorder: steps per write buffer, and buffers waiting for the disk at most
+    RECORD_BUFFER_STEPS = 256
+    RECORD_QUEUE_CHUNKS = 8
+
+    # Simulated seconds between the keyframes of the seek index
+    RECORD_KEYFRAME_INTERVAL = 1.0
+
+    # Block timesteps: each body steps dt / 2^level (level up to BLOCK_MAX_LEVEL), with the step at most
+    # BLOCK_ETA times its time scale |acceleration| / |jerk|. Replaces INTEGRATOR in the simulation when on
+    BLOCK_TIMESTEPS = False
+    BLOCK_MAX_LEVEL = 8
+    BLOCK_ETA = 0.01
+
+    # Ensembles: mass of the launched body, launch ranges of --ensemble, and chunks of runs per worker process
+    ENSEMBLE_LAUNCH_MASS = 10.0
+    ENSEMBLE_RADIUS = (60.0, 400.0)
+    ENSEMBLE_SPEED = (100.0, 500.0)
+    ENSEMBLE_ANGLE = (45.0, 135.0)
+    ENSEMBLE_CHUNKS_PER_WORKER = 4
+
+    # Integrator of the simulation and the predictions: "euler", "leapfrog", "yoshida4", "rk4" or "adaptive"
+    INTEGRATOR = "leapfrog"
+
+    # Error control of the "adaptive" integrator: tolerances [px, px/s] and substeps per step at most
+    INTEGRATOR_RTOL = 1e-6
+    INTEGRATOR_ATOL = 1e-4
+    INTEGRATOR_MAX_SUBSTEPS = 64
+
+    # Gravity kernel: upper bound of the temporary memory per tile of the pairwise force matrix
+    GRAVITY_TILE_BYTES = 8 * 2**20
@@ -5,7 +5,14 @@ layout(local_size_x=COMPUTE_SIZE_X, local_size_y=COMPUTE_SIZE_Y) in;
 
 // Uniforms:
 uniform float dt;
-uniform vec3 planets[10];
+uniform int n_particles;
+uniform int n_planets;
+
+// Planet table: position and gravitational parameter (x, y, 0, GM)
+layout(std430, binding=2) buffer planets_in
+{
+    vec4 planets[];
+} Planets;
 
 // Structure of the ball data
 struct Body
@@ -32,6 +39,10 @@ void main()
     // Get the index of the current body
     int index = int(gl_GlobalInvocationID);
 
+    // The last work group can reach past the live particles
+    if (index >= n_particles)
+        return;
+
     // Current body
     Body current_body = In.bodies[index];
 
@@ -40,12 +51,12 @@ void main()
     vec4 v = current_body.vel.xyzw;
     vec4 c = current_body.color.xyzw;
 
-    for(int i = 0; i < 10; ++i)
+    for(int i = 0; i < n_planets; ++i)
     {
-        vec3 current_planet = planets[i];
+        vec4 current_planet = Planets.planets[i];
 
         vec2 body_pos = current_planet.xy;
-        float body_gm = current_planet.z;
+        float body_gm = current_planet.w;
 
         // Vector pointing from ball to the Sun
         vec2 R = normalize(body_pos - p.xy);
@@ -63,6 +74,11 @@ void main()
     // Update position
     p.xy += v.xy * dt;
 
+    // Age (p.z) and fade out over the fade time (p.w), particles without a fade time keep their alpha
+    p.z += dt;
+    if (p.w > 0.0)
+        c.w = clamp(1.0 - p.z / p.w, 0.0, 1.0);
+
     // Create output ball
     Body output_body;
 
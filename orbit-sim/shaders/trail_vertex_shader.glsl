@@ -0,0 +1,24 @@
+#version 330
+
+// Use arcade's global projection UBO
+uniform Projection {
+    mat4 matrix;
+} proj;
+
+// Color of all the points in one draw call
+uniform vec4 color;
+
+// Input
+in vec2 in_pos;
+
+// Output
+out vec4 vertex_color;
+
+void main()
+{
+    // Project from screen space to openGL space
+    gl_Position = proj.matrix * vec4(in_pos, 0.0, 1.0);
+
+    // Assign vertex color
+    vertex_color = color;
+}
@@ -1,4 +1,4 @@
-#version 430
+#version 330
 //
 // Use arcade's global projection UBO
 uniform Projection {
@@ -1 +1,4 @@
-from .particle_bursts import ParticleBurstHandler, Burst
+from .particle_bursts import ParticleBurstHandler, Burst, create_particle_handler
+from .cpu_particles import CPUParticleBurstHandler
+from .trails import TrailRenderer
+from .bodies import BodyRenderer
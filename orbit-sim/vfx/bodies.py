@@ -0,0 +1,48 @@
+from typing import Optional
+import arcade
+import numpy as np
+from orbit_simulation.body_store import BodyStore
+from settings import VFXSettings as VFX
+from vfx.culling import GridIndex, Rect, overlaps
+
+
+class BodyRenderer:
+    """Draws a filled circle for each celestial body in view, one draw call per body.
+    The bodies are culled by their bounding boxes, with one vectorized test of all boxes per frame while the
+    simulation runs. With very many bodies standing still for a frame (e.g. paused while panning), a grid index
+    finds the bodies in view without testing every box; it is rebuilt whenever the bodies moved.
+    """
+
+    def __init__(self):
+        self.grid: Optional[GridIndex] = None
+        self.grid_key = None
+        self.seen_key = None
+
+        # Bodies outside of the view in the last frame
+        self.culled = 0
+
+    def visible(self, store: BodyStore, rect: Rect) -> np.ndarray:
+        """Slots of the bodies whose bounding box overlaps the rectangle."""
+        positions, sizes = store.positions, store.sizes
+        candidates = slice(None)
+
+        if len(store) >= VFX.CULL_GRID_MIN_BODIES:
+            key = (store, store.version)
+            if key != self.grid_key and key == self.seen_key:
+                self.grid = GridIndex(positions, sizes)
+                self.grid_key = key
+
+            self.seen_key = key
+            if key == self.grid_key:
+                candidates = self.grid.query(rect)
+
+        slots = np.arange(len(store))[candidates]
+        position, size = positions[slots], sizes[slots, None]
+        return slots[overlaps(position - size, position + size, rect)]
+
+    def draw(self, store: BodyStore, rect: Optional[Rect] = None):
+        slots = self.visible(store, rect) if rect is not None else range(len(store))
+        self.culled = len(store) - len(slots)
+
+        for slot in slots:
+            arcade.draw_circle_filled(*store.positions[slot], radius=store.sizes[slot], color=tuple(int(c) for c in store.colors[slot]))
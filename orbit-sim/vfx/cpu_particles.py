@@ -0,0 +1,118 @@
+from typing import Optional
+import numpy as np
+from orbit_simulation.body_store import BodyStore
+from vfx.culling import Rect, overlaps, runs
+from vfx.particle_bursts import ParticleArena, dead_particles
+
+
+def integrate_particles(data: np.ndarray, dt: float, planets: np.ndarray, chunk: int = 32768) -> None:
+    """NumPy version of compute_shader.glsl, updates the (n, 12) particle data in place.
+    planets is the planet table: the position and gravitational parameter (x, y, 0, GM) of each planet.
+    Every particle is pulled by all planets, then moved with its new velocity, and fades out over its fade time.
+    """
+    positions, velocities = data[:, 0:2], data[:, 4:6]
+    planet_positions, planet_gm = planets[:, 0:2], planets[:, 3]
+
+    for start in range(0, len(data), chunk):
+        p = positions[start:start + chunk]
+
+        # Vector pointing from the particle to each planet
+        d = planet_positions[None, :, :] - p[:, None, :]
+        r2 = np.einsum("ijk,ijk->ij", d, d)
+
+        # Newton's law: GM / r^2 along the unit vector d / r
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = planet_gm / (r2 * np.sqrt(r2))
+        w[~np.isfinite(w)] = 0.0
+
+        # Update velocity
+        velocities[start:start + chunk] += np.einsum("ij,ijk->ik", w, d) * dt
+
+    # Update position
+    positions += velocities * dt
+
+    # Age and fade out (particles without a fade time keep their alpha)
+    age, fade_time = data[:, 2], data[:, 3]
+    age += dt
+    np.clip(1.0 - np.divide(age, fade_time, out=np.zeros_like(age), where=fade_time > 0), 0.0, 1.0,
+            out=data[:, 11], where=fade_time > 0)
+
+
+class CPUParticleBurstHandler(ParticleArena):
+    """Simulates particle bursts with NumPy, for hosts without OpenGL 4.3 compute shaders.
+    The arena is a single (slots * PARTICLE_COUNT, 12) array in the std430 layout of the GPU version,
+    so it is uploaded to the vertex buffer as it is. Without a context it runs headless (nothing is drawn).
+    """
+
+    def __init__(self, ctx=None):
+        super().__init__()
+        self.ctx = ctx
+
+        self.data = np.concatenate([dead_particles(self.particle_count)] * self.n_slots)
+        self.dt = 0.0
+
+        if self.ctx is not None:
+            from vfx.particle_bursts import compile_particle_program, make_particle_geometry
+
+            # Enable alpha blending
+            self.ctx.enable(self.ctx.BLEND)
+
+            self.program = compile_particle_program(self.ctx)
+            self.buffer = self.ctx.buffer(reserve=self.data.nbytes, usage="stream")
+            self.vao = make_particle_geometry(self.ctx, self.buffer)
+
+    def set_uniforms(self, dt: float, store: BodyStore):
+        self.dt = dt
+        self.update_planets(store)
+
+    def write_slot(self, slot: int, data: np.ndarray) -> None:
+        start = slot * self.particle_count
+        self.data[start:start + self.particle_count] = data
+
+    def read_live(self) -> np.ndarray:
+        return self.data[:self.get_live_count()].copy()
+
+    def step(self, dt: Optional[float] = None) -> None:
+        """Advance the live particles by dt (by default the dt of set_uniforms), in substeps of PARTICLE_MAX_DT at most."""
+        n_particles = self.get_live_count()
+        count, dt = self.substeps(self.dt if dt is None else dt)
+        for _ in range(count):
+            integrate_particles(self.data[:n_particles], dt, self.planets)
+
+    def visible_slots(self, rect: Rect) -> np.ndarray:
+        """Mask of the live slots with particles in the rectangle, by the bounding box of each slot."""
+        positions = self.data[:self.get_live_count(), 0:2].reshape(-1, self.particle_count, 2)
+        return overlaps(positions.min(axis=1), positions.max(axis=1), rect)
+
+    def draw(self, paused: bool, rect: Optional[Rect] = None):
+        self.culled = 0
+        if not paused:
+            self.expire_bursts(self.dt)
+
+        n_particles = self.get_live_count()
+        if not n_particles:
+            return
+
+        if not paused:
+            self.step()
+
+        if self.ctx is None:
+            return
+
+        if rect is None:
+            # Upload the live range and draw the points
+            self.buffer.write(self.data[:n_particles])
+            self.vao.render(self.program, vertices=n_particles)
+            return
+
+        # Only the runs of slots in view are uploaded and drawn
+        visible = self.visible_slots(rect)
+        live = np.zeros(len(visible), dtype=bool)
+        live[[burst.slot for burst in self.bursts]] = True
+        self.culled = sum(burst.n_particles for burst in self.bursts if not visible[burst.slot])
+
+        for start, stop in zip(*runs(visible & live)):
+            first, last = start * self.particle_count, stop * self.particle_count
+            self.buffer.write(self.data[first:last], offset=first * self.data.itemsize * self.data.shape[1])
+            self.vao.render(self.program, first=first, vertices=last - first)
+
@@ -0,0 +1,100 @@
+from typing import Callable, Optional
+import arcade.gl
+import numpy as np
+from orbit_simulation.barnes_hut import _ragged_arange
+from settings import VFXSettings as VFX
+
+# Visible part of the world: (left, bottom, right, top) in screen space
+Rect = tuple[float, float, float, float]
+
+
+def overlaps(lo: np.ndarray, hi: np.ndarray, rect: Rect) -> np.ndarray:
+    """Mask of the (n, 2) bounding boxes from lo to hi that overlap the rectangle."""
+    left, bottom, right, top = rect
+    return (hi[:, 0] >= left) & (lo[:, 0] <= right) & (hi[:, 1] >= bottom) & (lo[:, 1] <= top)
+
+
+def runs(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start and stop indices of the runs of consecutive True values of the mask."""
+    edges = np.diff(np.r_[0, mask.astype(np.int8), 0])
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class GridIndex:
+    """Uniform grid of boxes for range queries, e.g. the bodies in view out of a very large number of bodies.
+    Each box is filed under the cell of its center and the boxes are sorted by cell, so the boxes of a row of
+    cells are one range of the sorted order. A query visits the cell rows of the rectangle, grown by the
+    largest half-size of the boxes, so it returns every box that overlaps the rectangle (and a few that do not).
+    """
+
+    def __init__(self, centers: np.ndarray, half_sizes: np.ndarray, cell_size: float = VFX.CULL_GRID_CELL):
+        self.cell_size = cell_size
+        self.margin = float(half_sizes.max(initial=0.0))
+
+        cells = np.floor(centers / cell_size).astype(np.int64)
+        self.origin = cells.min(axis=0) if len(cells) else np.zeros(2, dtype=np.int64)
+        cells -= self.origin
+        self.shape = cells.max(axis=0) + 1 if len(cells) else np.zeros(2, dtype=np.int64)
+
+        keys = cells[:, 1] * self.shape[0] + cells[:, 0]
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def query(self, rect: Rect) -> np.ndarray:
+        """Indices of the boxes in the cells around the rectangle."""
+        left, bottom, right, top = rect
+        lo = np.floor((np.array([left, bottom]) - self.margin) / self.cell_size).astype(np.int64) - self.origin
+        hi = np.floor((np.array([right, top]) + self.margin) / self.cell_size).astype(np.int64) - self.origin
+        lo, hi = np.maximum(lo, 0), np.minimum(hi, self.shape - 1)
+        if (lo > hi).any():
+            return np.empty(0, dtype=np.intp)
+
+        # One range of keys per row of cells
+        rows = np.arange(lo[1], hi[1] + 1) * self.shape[0]
+        start = np.searchsorted(self.keys, rows + lo[0], side="left")
+        stop = np.searchsorted(self.keys, rows + hi[0], side="right")
+        return self.order[_ragged_arange(start, stop - start)]
+
+
+class VertexSubset:
+    """Draws a subset of the vertices of a vertex buffer (points, or the ends of line segments), listed in an index buffer.
+    The indices are only rebuilt and uploaded when the subset changes, or patched where they changed.
+    """
+
+    def __init__(self, ctx: arcade.ArcadeContext, mode: Optional[int] = None):
+        self.ctx = ctx
+        self.mode = ctx.POINTS if mode is None else mode
+        self.index_buffer: Optional[arcade.gl.Buffer] = None
+        self.geometry: Optional[arcade.gl.Geometry] = None
+        self.vertex_buffer: Optional[arcade.gl.Buffer] = None
+        self.key = None
+        self.count = 0
+
+    def update(self, vertex_buffer: arcade.gl.Buffer, key, make_indices: Callable[[], np.ndarray], force: bool = False) -> None:
+        """Use the indices given by make_indices, unless the vertex buffer and the key are the same as last time."""
+        if not force and vertex_buffer is self.vertex_buffer and key == self.key:
+            return
+
+        indices = make_indices().astype(np.uint32)
+        if self.index_buffer is None or self.index_buffer.size < indices.nbytes or vertex_buffer is not self.vertex_buffer:
+            self.index_buffer = self.ctx.buffer(reserve=max(indices.nbytes, 4), usage="dynamic")
+            self.geometry = self.ctx.geometry(
+                [arcade.gl.BufferDescription(vertex_buffer, "2f", ["in_pos"])],
+                index_buffer=self.index_buffer,
+                mode=self.mode,
+            )
+
+        if len(indices):
+            self.index_buffer.write(indices)
+        self.vertex_buffer = vertex_buffer
+        self.key = key
+        self.count = len(indices)
+
+    def patch(self, start: int, indices: np.ndarray) -> None:
+        """Replace the indices from position start on, within the current count."""
+        self.index_buffer.write(indices.astype(np.uint32), offset=start * 4)
+
+    def render(self, program: arcade.gl.Program, first: int = 0, vertices: Optional[int] = None) -> None:
+        vertices = self.count - first if vertices is None else vertices
+        if vertices > 0:
+            self.geometry.render(program, first=first, vertices=vertices)
@@ -1,66 +1,261 @@
-import array
-from typing import Optional, Tuple
+import heapq
+from typing import Iterable, Optional, Tuple
 import arcade.gl
 import numpy as np
-import random
-from utils import normalize, rotate_vector_2D
+from utils import normalize
 from dataclasses import dataclass
-from orbit_simulation.celestial_body import CelestialBody
+from orbit_simulation.body_store import BodyStore
+from vfx.culling import Rect
 from settings import VFXSettings as VFX
 from settings import OrbitSettings
 
 
+# Floats per particle in the std430 layout: position, velocity and color, each padded to a vec4
+PARTICLE_FLOATS = 12
+
+
+def generate_particles(pos, vel, col, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Initial particle data (count, 12) float32 of a burst, in the std430 "4f 4x4 4f" buffer layout.
+    The padding of the position holds the age of the particle and the time it takes to fade out.
+    """
+
+    # Get the direction and magnitude of the velocity:
+    direction, speed = normalize(np.asarray(vel, dtype=np.float64))
+
+    # Add random gaussian angle and speed deviation to the velocity
+    angle_deviation = rng.normal(0.0, VFX.PARTICLE_SPREAD_ANGLE, count)
+    speed_deviation = rng.normal(0.0, VFX.PARTICLE_SPREAD_SPEED, count)
+
+    # The speed deviations accumulate from particle to particle, but the speed never goes backwards:
+    # speed_k = max(0, speed_k-1 + deviation_k), evaluated at once as a random walk reflected at zero
+    walk = speed + np.cumsum(speed_deviation)
+    speeds = walk - np.minimum(np.minimum.accumulate(walk), 0.0)
+
+    # Rotate the velocity of each particle with its angle deviation
+    ca, sa = np.cos(angle_deviation), np.sin(angle_deviation)
+    vx, vy = direction[0] * speeds, direction[1] * speeds
+
+    # Padding for std430 buffer layout (the zero padding is already in place):
+    data = np.zeros((count, PARTICLE_FLOATS), dtype=np.float32)
+    data[:, 0:2] = pos[0], pos[1]
+    data[:, 3] = rng.uniform(VFX.PARTICLE_MIN_FADE_TIME, VFX.PARTICLE_MAX_FADE_TIME, count)
+    data[:, 4] = ca * vx - sa * vy
+    data[:, 5] = sa * vx + ca * vy
+
+    # Color is in [0, 1] space
+    data[:, 8:11] = np.asarray(col[:3], dtype=np.float32) / 255.0
+    data[:, 11] = 1.0
+
+    return data
+
+
+def dead_particles(count: int) -> np.ndarray:
+    """Particle data of an empty slot: invisible and parked far away from the planets."""
+    data = np.zeros((count, PARTICLE_FLOATS), dtype=np.float32)
+    data[:, 0:2] = 1e9
+    return data
+
+
 @dataclass
 class Burst:
-    ssbo_1: arcade.gl.Buffer
-    ssbo_2: arcade.gl.Buffer
-    vao_1: arcade.gl.Geometry
-    vao_2: arcade.gl.Geometry
+    """A burst occupies one slot of PARTICLE_COUNT particles in the particle arena."""
+
+    slot: int
+    n_particles: int
+    age: float = 0.0
+
+
+class ParticleArena:
+    """Bookkeeping of the particle bursts.
+    All particles live in one preallocated arena of PARTICLE_ARENA_SLOTS slots, one burst per slot.
+    Free slots are tracked in a free-list. A burst expires once all of its particles have faded out
+    (PARTICLE_MAX_FADE_TIME), which pushes its slot back on the free-list; when the arena is still full, a new burst
+    recycles the slot of the oldest one. Subclasses store the particle data of the slots.
+    """
+
+    def __init__(self):
+        # Particle settings
+        self.particle_count = VFX.PARTICLE_COUNT
+        self.rng = np.random.default_rng()
+
+        # Live bursts from oldest to newest and the free slots of the arena (lowest first)
+        self.n_slots = VFX.PARTICLE_ARENA_SLOTS
+        self.bursts: list[Burst] = []
+        self.free_slots = list(range(self.n_slots))
+
+        # Planet table: one (x, y, 0, GM) row per body (std430 vec4), refreshed when the store changes
+        self._planets = np.zeros((16, 4), dtype=np.float32)
+        self.n_planets = 0
+        self.planets_key = None
+
+        # Particles outside of the view in the last frame (only known where the particles are simulated on the CPU)
+        self.culled = 0
+
+    @property
+    def planets(self) -> np.ndarray:
+        return self._planets[:self.n_planets]
+
+    def update_planets(self, store: BodyStore) -> bool:
+        """Copy the positions and masses of the store into the planet table.
+        Returns False (and does nothing) when the store has not changed since the last update.
+        """
+        key = (store, store.version)
+        if key == self.planets_key:
+            return False
+
+        self.planets_key = key
+        self.n_planets = len(store)
+        if self.n_planets > len(self._planets):
+            self._planets = np.zeros((2 * self.n_planets, 4), dtype=np.float32)
+
+        self._planets[:self.n_planets, 0:2] = store.positions
+        self._planets[:self.n_planets, 3] = store.masses * OrbitSettings.G
+        return True
+
+    @staticmethod
+    def substeps(dt: float) -> tuple[int, float]:
+        """Split a frame of dt simulated seconds into (count, length) particle steps of PARTICLE_MAX_DT at most."""
+        if dt <= 0.0:
+            return 0, 0.0
+
+        count = int(np.ceil(dt / VFX.PARTICLE_MAX_DT - 1e-9))
+        return count, dt / count
+
+    def get_live_count(self) -> int:
+        """Number of particles up to the end of the highest live slot: the range that is simulated and drawn."""
+        if not self.bursts:
+            return 0
+
+        return (max(burst.slot for burst in self.bursts) + 1) * self.particle_count
+
+    def get_nr_particles(self) -> int:
+        return sum(burst.n_particles for burst in self.bursts)
+
+    def write_slot(self, slot: int, data: np.ndarray) -> None:
+        """Store the particle data of a slot."""
+        raise NotImplementedError
+
+    def read_live(self) -> np.ndarray:
+        """Particle data (get_live_count(), 12) of the live range."""
+        raise NotImplementedError
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Particle data of the live range and the bursts (slot, particle count) from oldest to newest."""
+        bursts = np.array([(burst.slot, burst.n_particles) for burst in self.bursts], dtype=np.int64).reshape(-1, 2)
+        return dict(data=self.read_live(), bursts=bursts)
+
+    def restore(self, arrays: dict[str, np.ndarray]) -> None:
+        """Replace the bursts with the ones given by state()."""
+        self.clear_all()
+        data = arrays["data"]
+
+        # The live range includes the freed slots in between, they hold invisible particles
+        for slot in range(len(data) // self.particle_count):
+            self.write_slot(slot, data[slot * self.particle_count:(slot + 1) * self.particle_count])
+
+        # The age of a burst is the age of its particles
+        for slot, n_particles in arrays["bursts"].tolist():
+            self.free_slots.remove(slot)
+            age = float(data[slot * self.particle_count:(slot + 1) * self.particle_count, 2].max())
+            self.bursts.append(Burst(slot=slot, n_particles=n_particles, age=age))
 
+        heapq.heapify(self.free_slots)
+
+    def generate_particles(self, events: Iterable[tuple]) -> np.ndarray:
+        """Initial particle data of one burst per (pos, vel, col) event, concatenated."""
+        return np.concatenate([generate_particles(pos, vel, col, self.particle_count, self.rng) for pos, vel, col in events])
+
+    def allocate_slot(self) -> int:
+        """Take the lowest free slot. When the arena is full, the oldest burst is recycled."""
+        if self.free_slots:
+            return heapq.heappop(self.free_slots)
+
+        return self.bursts.pop(0).slot
+
+    def create_burst(self, pos, vel, col):
+        self.create_bursts([(pos, vel, col)])
+
+    def create_bursts(self, events: Iterable[tuple]):
+        """Create a burst for each (pos, vel, col) event, each in its own slot of the arena."""
+        events = list(events)
+        if not events:
+            return
+
+        # Get initial particle data
+        initial_data = self.generate_particles(events)
+        print(f"Generating {len(initial_data)} particles in {len(events)} bursts.")
+
+        for idx in range(len(events)):
+            burst = Burst(slot=self.allocate_slot(), n_particles=self.particle_count)
+            self.write_slot(burst.slot, initial_data[idx * self.particle_count:(idx + 1) * self.particle_count])
+            self.bursts.append(burst)
+
+    def expire_bursts(self, dt: float) -> None:
+        """Age the bursts by dt simulated seconds and free the slots of the bursts that have faded out."""
+        expired = []
+        for burst in self.bursts:
+            burst.age += dt
+            if burst.age >= VFX.PARTICLE_MAX_FADE_TIME:
+                expired.append(burst)
+
+        for burst in expired:
+            self.bursts.remove(burst)
+            self.write_slot(burst.slot, dead_particles(burst.n_particles))
+            heapq.heappush(self.free_slots, burst.slot)
+
+    def clear_all(self):
+        """Free every slot. The storage is kept, the next bursts start from the first slot again."""
+        self.bursts = []
+        self.free_slots = list(range(self.n_slots))
+
+
+class ParticleBurstHandler(ParticleArena):
+    """Simulates and draws particle bursts on the GPU with a compute shader (OpenGL 4.3).
+    The arena is kept in a pair of storage buffers that the compute shader ping-pongs between.
+    """
 
-class ParticleBurstHandler:
     def __init__(self, ctx: arcade.ArcadeContext):
+        super().__init__()
+
         # Store the context
         self.ctx = ctx
 
         # Enable alpha blending
         self.ctx.enable(self.ctx.BLEND)
 
-        # Storage for Burst objects
-        self.bursts: list[Burst] = []
-
-        # Particle settings
-        self.particle_count = VFX.PARTICLE_COUNT
-
-        # Group layout for compute shader
-        self.group_x, self.group_y = VFX.COMPUTE_SHADER_GROUP_COUNTS
+        # Local group size of the compute shader
+        self.group_x, self.group_y = VFX.COMPUTE_SHADER_LOCAL_SIZE
 
         # Compile shaders
         self.compute_shader, self.program = self.compile_shaders()
 
         print("Successfully compiled shaders")
 
-    def get_nr_particles(self) -> int:
-        return len(self.bursts) * self.particle_count
+        # Particle arena: the compute shader reads ssbo_1 and writes ssbo_2, then they are swapped
+        self.slot_bytes = self.particle_count * PARTICLE_FLOATS * 4
+        self.ssbo_1 = self.ctx.buffer(reserve=self.n_slots * self.slot_bytes)
+        self.ssbo_2 = self.ctx.buffer(reserve=self.n_slots * self.slot_bytes)
+        self.vao_1 = make_particle_geometry(self.ctx, self.ssbo_1)
+        self.vao_2 = make_particle_geometry(self.ctx, self.ssbo_2)
 
-    def set_uniforms(self, dt: float, bodies: list[CelestialBody]):
-        self.compute_shader["dt"] = dt
+        # Simulated time of the frame
+        self.dt = 0.0
+
+        # Planet table, read by the compute shader
+        self.planet_ssbo = self.ctx.buffer(reserve=self._planets.nbytes, usage="dynamic")
 
-        x = []
-        for idx in range(10):
-            try:
-                body = bodies[idx]
-                pos = body.position
-                GM = body.mass * OrbitSettings.G
-            except IndexError:
-                pos = (1_000_000_000.0, 1_000_000_000)
-                GM = 0.00000001
+    def set_uniforms(self, dt: float, store: BodyStore):
+        self.dt = dt
 
-            x.append(pos[0])
-            x.append(pos[1])
-            x.append(GM)
+        if not self.update_planets(store):
+            return
 
-        self.compute_shader["planets"] = x
+        # Grow the planet buffer when the bodies no longer fit, otherwise overwrite it in place
+        if self.planet_ssbo.size < self.planets.nbytes:
+            self.planet_ssbo.orphan(size=self._planets.nbytes)
+
+        self.planet_ssbo.write(self.planets)
+        self.compute_shader["n_planets"] = self.n_planets
 
     def compile_shaders(self) -> Tuple[arcade.gl.Program, arcade.gl.Program]:
         # Compile shaders
@@ -68,14 +263,8 @@ class ParticleBurstHandler:
         with open(VFX.COMPUTE_SHADER) as file:
             compute_shader_source = file.read()
 
-        with open(VFX.VERTEX_SHADER) as file:
-            vertex_shader_source = file.read()
-
-        with open(VFX.FRAGMENT_SHADER) as file:
-            fragment_shader_source = file.read()
-
         # Create our compute shader.
-        # Search/replace to set up our compute groups
+        # Search/replace to set up the local size of our compute groups
         compute_shader_source = compute_shader_source.replace("COMPUTE_SIZE_X",
                                                               str(self.group_x))
         compute_shader_source = compute_shader_source.replace("COMPUTE_SIZE_Y",
@@ -83,120 +272,97 @@ class ParticleBurstHandler:
         compute_shader = self.ctx.compute_shader(source=compute_shader_source)
 
         # Program for visualizing the balls
-        program = self.ctx.program(
-            vertex_shader=vertex_shader_source,
-            fragment_shader=fragment_shader_source,
-        )
+        program = compile_particle_program(self.ctx)
 
         return compute_shader, program
 
-    def generate_particles(self, pos, vel, col):
-        print(f"Generating {self.particle_count} particles at position: {pos} with mean velocity {vel}")
+    def write_slot(self, slot: int, data: np.ndarray) -> None:
+        # Write into both buffers, so the burst shows up even while paused
+        for ssbo in (self.ssbo_1, self.ssbo_2):
+            ssbo.write(data, offset=slot * self.slot_bytes)
+
+    def read_live(self) -> np.ndarray:
+        # ssbo_1 holds the latest state after the swaps of draw
+        n_particles = self.get_live_count()
+        data = self.ssbo_1.read(size=n_particles * PARTICLE_FLOATS * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(n_particles, PARTICLE_FLOATS)
+
+    def draw(self, paused: bool, rect: Optional[Rect] = None):
+        """Step and draw the particles. They stay on the GPU, so they are not culled against the view rectangle:
+        the points out of view are clipped right after the vertex shader.
+        """
+        if not paused:
+            self.expire_bursts(self.dt)
 
-        # Color is in [0, 1] space
-        col = np.array(col) / 255.0
+        n_particles = self.get_live_count()
+        if not n_particles:
+            return
 
-        # Get the direction and magnitude of the velocity:
-        direction, speed = normalize(vel)
+        # Run the compute shader over all live particles, once per substep of the simulated frame time
+        count, dt = self.substeps(0.0 if paused else self.dt)
+        self.planet_ssbo.bind_to_storage_buffer(binding=2)
+        self.compute_shader["n_particles"] = n_particles
+        self.compute_shader["dt"] = dt
 
-        for _ in range(self.particle_count):
+        for _ in range(count):
+            # Bind buffers
+            self.ssbo_1.bind_to_storage_buffer(binding=0)
+            self.ssbo_2.bind_to_storage_buffer(binding=1)
 
-            # Add random gaussian angle and speed deviation to the velocity
-            angle_deviation = random.gauss(0, VFX.PARTICLE_SPREAD_ANGLE)
-            speed_deviation = random.gauss(0.0, VFX.PARTICLE_SPREAD_SPEED)
+            self.compute_shader.run(group_x=-(-n_particles // self.group_x), group_y=1)
 
-            # Make sure the noise doesn't make it go backwards:
-            speed += speed_deviation
-            if speed < 0:
-                speed = 0.0
+            # Swap the buffers
+            self.ssbo_1, self.ssbo_2 = self.ssbo_2, self.ssbo_1
 
-            # add the angle deviation to the final vector:
-            vel = rotate_vector_2D(v=direction * speed, angle=angle_deviation)
+            # Swap the geometry
+            self.vao_1, self.vao_2 = self.vao_2, self.vao_1
 
-            # Padding for std430 buffer layout:
-            pos = (pos[0], pos[1], 0.0, 0.0)
-            vel = (vel[0], vel[1], 0.0, 0.0)
-            col = (col[0], col[1], col[2], 1.0)
+        # Draw the points of the latest state
+        self.vao_1.render(self.program, vertices=n_particles)
 
-            # Yeild a single element at once for the buffer
-            for f in (*pos, *vel, *col):
-                yield f
 
-    def create_planet_data_buffer(self, bodies: list[CelestialBody]) -> arcade.gl.Buffer:
+def create_particle_handler(ctx: arcade.ArcadeContext) -> ParticleArena:
+    """Particle handler for the context: the compute shader when OpenGL 4.3 is available, NumPy otherwise."""
+    backend = VFX.PARTICLE_BACKEND
+    if backend == "auto":
+        backend = "gpu" if ctx.gl_version >= (4, 3) else "cpu"
 
-        def generate_data_points():
+    if backend == "gpu":
+        return ParticleBurstHandler(ctx=ctx)
 
-            for body in bodies:
-                pos = body.position
-                body_GM = body.mass * OrbitSettings.G
-                for f in (pos[0], pos[1], 0.0, body_GM):
-                    yield f
+    from vfx.cpu_particles import CPUParticleBurstHandler
+    print(f"Simulating particles on the CPU (OpenGL {ctx.gl_version[0]}.{ctx.gl_version[1]})")
+    return CPUParticleBurstHandler(ctx=ctx)
 
-        initial_data = generate_data_points()
-        ssbo = self.ctx.buffer(data=array.array("f", initial_data))
-        return ssbo
 
-    def create_burst(self, pos, vel, col):
+def compile_particle_program(ctx: arcade.ArcadeContext) -> arcade.gl.Program:
+    """Program that draws the particles as colored points."""
 
-        # Get initial particle data
-        initial_data = self.generate_particles(pos, vel, col)
-
-        # Create two buffers for compute shader
-        ssbo_1 = self.ctx.buffer(data=array.array("f", initial_data))
-        ssbo_2 = self.ctx.buffer(reserve=ssbo_1.size)
-
-        # Buffer format (position, velocity, color) with std430 layout:
-        buffer_format = "4f 4x4 4f"
-
-        # Vertex shader inputs:
-        attributes = ["in_pos", "in_col"]
-
-        # Vertex attribute objects:
-        vao_1 = self.ctx.geometry(
-            [arcade.gl.BufferDescription(
-                ssbo_1,
-                buffer_format,
-                attributes,
-            )],
-            mode=self.ctx.POINTS
-        )
-
-        vao_2 = self.ctx.geometry(
-            [arcade.gl.BufferDescription(
-                ssbo_2,
-                buffer_format,
-                attributes,
-            )],
-            mode=self.ctx.POINTS
-        )
-
-        # Create the Burst object and add it to the list of bursts
-        burst = Burst(ssbo_1, ssbo_2, vao_1, vao_2)
-        self.bursts.append(burst)
-        print(f"ParticleBurst created with {self.particle_count} particles.")
-
-    def draw_burst(self, burst: Burst, paused: bool):
-        # Bind buffers
-        burst.ssbo_1.bind_to_storage_buffer(binding=0)
-        burst.ssbo_2.bind_to_storage_buffer(binding=1)
-
-        # Run compute shader
-        if not paused:
-            self.compute_shader.run(group_x=self.group_x, group_y=self.group_y)
+    with open(VFX.VERTEX_SHADER) as file:
+        vertex_shader_source = file.read()
 
-        # Draw the points
-        burst.vao_2.render(self.program)
+    with open(VFX.FRAGMENT_SHADER) as file:
+        fragment_shader_source = file.read()
 
-        if not paused:
-            # Swap the buffers
-            burst.ssbo_1, burst.ssbo_2 = burst.ssbo_2, burst.ssbo_1
+    return ctx.program(
+        vertex_shader=vertex_shader_source,
+        fragment_shader=fragment_shader_source,
+    )
 
-            # Swap the geometry
-            burst.vao_1, burst.vao_2 = burst.vao_2, burst.vao_1
 
-    def draw(self, paused: bool):
-        for b in self.bursts:
-            self.draw_burst(b, paused)
+def make_particle_geometry(ctx: arcade.ArcadeContext, buffer: arcade.gl.Buffer) -> arcade.gl.Geometry:
+    # Buffer format (position, velocity, color) with std430 layout:
+    buffer_format = "4f 4x4 4f"
 
-    def clear_all(self):
-        self.bursts = []
+    # Vertex shader inputs:
+    attributes = ["in_pos", "in_col"]
+
+    # Vertex attribute object:
+    return ctx.geometry(
+        [arcade.gl.BufferDescription(
+            buffer,
+            buffer_format,
+            attributes,
+        )],
+        mode=ctx.POINTS
+    )
@@ -0,0 +1,246 @@
+from typing import Optional
+import arcade.gl
+import numpy as np
+from orbit_simulation.body_store import BodyStore
+from orbit_simulation.predictor import Prediction
+from settings import VFXSettings as VFX
+from settings import Color
+from vfx.culling import Rect, VertexSubset, overlaps, runs
+
+
+def column_bounds(points: np.ndarray, empty: float = BodyStore.HISTORY_EMPTY) -> tuple[np.ndarray, np.ndarray]:
+    """Bounding boxes (lo, hi), each (columns, 2), of the points (rows, columns, 2) of each column.
+    Empty points are left out, a column without points gets an empty box (lo = inf, hi = -inf).
+    """
+    missing = points[..., :1] >= empty / 2
+    return np.where(missing, np.inf, points).min(axis=0), np.where(missing, -np.inf, points).max(axis=0)
+
+
+def history_segments(store: BodyStore, rows: np.ndarray) -> np.ndarray:
+    """Line segments (rows, capacity, 2) from each point of the given rows of the history buffer to the next point of
+    its body, as vertex indices into the buffer. The points of a body are the count rows before its head (mod
+    history_length): the segments that do not join two of them (from the newest point back to the oldest, and
+    through empty points) collapse into a single vertex.
+    """
+    length, capacity, n = store.history_length, store.capacity, len(store)
+    counts, heads = np.zeros(capacity, dtype=np.int64), np.zeros(capacity, dtype=np.int64)
+    counts[:n], heads[:n] = store.history_counts, store.history_heads
+
+    rows, slots = np.asarray(rows)[:, None], np.arange(capacity)
+    start = rows * capacity + slots
+    joined = (rows - heads + counts) % length < counts - 1
+    stop = np.where(joined, (rows + 1) % length * capacity + slots, start)
+    return np.stack([start, stop], axis=-1).astype(np.uint32)
+
+
+class TrailRenderer:
+    """Draws the position histories as line segments and the predicted futures as points, one draw call each (plus
+    one for the aim fan). The data lives in persistent buffers: after a history sample only the rows written since
+    the last frame are uploaded, along with the segments that start in them or in the row before.
+
+    Trails are culled against the view by the bounding box of each trail. When only some are in view, their
+    segments are drawn through an index buffer that is rebuilt only when the set of visible trails changes; after a
+    history sample only the rows of segments that changed are patched in it.
+    """
+
+    def __init__(self, ctx: arcade.ArcadeContext):
+        self.ctx = ctx
+
+        with open(VFX.TRAIL_VERTEX_SHADER) as file:
+            vertex_shader_source = file.read()
+
+        with open(VFX.FRAGMENT_SHADER) as file:
+            fragment_shader_source = file.read()
+
+        self.program = self.ctx.program(
+            vertex_shader=vertex_shader_source,
+            fragment_shader=fragment_shader_source,
+        )
+
+        # History buffer mirrors BodyStore.history_buffer, the segment buffer holds its history_segments
+        self.history_buffer: Optional[arcade.gl.Buffer] = None
+        self.segment_buffer: Optional[arcade.gl.Buffer] = None
+        self.segments = np.empty((0, 0, 2), dtype=np.uint32)
+        self.history_geometry: Optional[arcade.gl.Geometry] = None
+        self.uploaded_store: Optional[BodyStore] = None
+        self.uploaded_shape = None
+        self.uploaded_version = -1
+        self.uploaded_steps = 0
+
+        # History step of the previous frame and the runs of segment rows (start, stop) that changed since
+        self.synced_steps = 0
+        self.segment_runs: list[tuple[int, int]] = []
+
+        # Bounds of the points of each history column, exact as of history step bounds_steps (they only grow since)
+        self.history_lo = self.history_hi = np.empty((0, 2))
+        self.bounds_steps = 0
+        self.visible_histories = VertexSubset(ctx, mode=ctx.LINES)
+        self.visible_steps = -1
+        self.culled_histories = 0
+
+        # Futures buffer holds the points of the latest prediction
+        self.future_buffer: Optional[arcade.gl.Buffer] = None
+        self.future_geometry: Optional[arcade.gl.Geometry] = None
+        self.uploaded_prediction: Optional[Prediction] = None
+        self.n_future_points = 0
+        self.n_fan_points = 0
+
+        # Bounds of each trail of the prediction: the bodies of the ephemeris, the new body and the aim fan
+        self.future_lo = self.future_hi = np.empty((0, 2))
+        self.visible_futures = VertexSubset(ctx)
+        self.culled_futures = 0
+
+    def make_geometry(self, buffer: arcade.gl.Buffer) -> arcade.gl.Geometry:
+        return self.ctx.geometry(
+            [arcade.gl.BufferDescription(buffer, "2f", ["in_pos"])],
+            mode=self.ctx.POINTS,
+        )
+
+    def sync_histories(self, store: BodyStore) -> None:
+        """Upload the history rows and segments that changed since the last frame."""
+        history = store.history_buffer
+        self.synced_steps, self.segment_runs = self.uploaded_steps, []
+
+        # Full upload when the store, the buffer layout or old rows changed
+        if (
+            self.history_buffer is None
+            or self.uploaded_store is not store
+            or self.uploaded_shape != history.shape
+            or self.uploaded_version != store.history_version
+        ):
+            self.segments = history_segments(store, np.arange(store.history_length))
+            self.history_buffer = self.ctx.buffer(data=history, usage="dynamic")
+            self.segment_buffer = self.ctx.buffer(data=self.segments, usage="dynamic")
+            self.history_geometry = self.ctx.geometry(
+                [arcade.gl.BufferDescription(self.history_buffer, "2f", ["in_pos"])],
+                index_buffer=self.segment_buffer,
+                mode=self.ctx.LINES,
+            )
+            self.uploaded_store = store
+            self.uploaded_shape = history.shape
+            self.uploaded_version = store.history_version
+            self.update_history_bounds(history, store.history_steps)
+
+        # Incremental upload of the rows written since the last frame, one contiguous write per run of rows.
+        # A segment changes when its row or the next row is written (the newest point of a body moved on).
+        elif store.history_steps != self.uploaded_steps:
+            written = store.history_written > self.uploaded_steps
+            for start, stop in zip(*runs(written)):
+                self.history_buffer.write(history[start:stop], offset=start * history[0].nbytes)
+
+            self.segment_runs = list(zip(*runs(written | np.roll(written, -1))))
+            for start, stop in self.segment_runs:
+                self.segments[start:stop] = history_segments(store, np.arange(start, stop))
+                self.segment_buffer.write(self.segments[start:stop], offset=start * self.segments[0].nbytes)
+
+            # The bounds grow with the new points, and shrink to the kept points every history_length samples
+            if store.history_steps - self.bounds_steps >= store.history_length:
+                self.update_history_bounds(history, store.history_steps)
+            else:
+                lo, hi = column_bounds(history[written])
+                np.minimum(self.history_lo, lo, out=self.history_lo)
+                np.maximum(self.history_hi, hi, out=self.history_hi)
+
+        self.uploaded_steps = store.history_steps
+
+    def update_history_bounds(self, history: np.ndarray, steps: int) -> None:
+        self.history_lo, self.history_hi = column_bounds(history)
+        self.bounds_steps = steps
+
+    def draw_histories(self, store: BodyStore, rect: Optional[Rect] = None) -> None:
+        self.sync_histories(store)
+        self.program["color"] = Color.to_float(Color.HISTORY_COLOR)
+        self.culled_histories = 0
+        if rect is None:
+            self.history_geometry.render(self.program)
+            return
+
+        # Trails without points are neither drawn nor counted
+        n = len(store)
+        visible = overlaps(self.history_lo[:n], self.history_hi[:n], rect)
+        drawn = store.history_counts > 0
+        self.culled_histories = int((drawn & ~visible).sum())
+        if not visible.any():
+            return
+
+        if (visible | ~drawn).all():
+            self.history_geometry.render(self.program)
+            return
+
+        # The same trails as in the last frame only need the segment rows that changed since, in rows of len(columns)
+        columns = np.flatnonzero(visible)
+        subset, key = self.visible_histories, columns.tobytes()
+        if subset.vertex_buffer is self.history_buffer and subset.key == key and self.visible_steps == self.synced_steps:
+            for start, stop in self.segment_runs:
+                subset.patch(start * len(columns) * 2, self.segments[start:stop, columns].ravel())
+        else:
+            subset.update(self.history_buffer, key, lambda: self.segments[:, columns].ravel(), force=True)
+
+        self.visible_steps = store.history_steps
+        subset.render(self.program)
+
+    def draw_futures(self, prediction: Optional[Prediction], rect: Optional[Rect] = None) -> None:
+        self.culled_futures = 0
+        if prediction is None:
+            return
+
+        # Upload each completed prediction once, the aim fan goes after the other points
+        if prediction is not self.uploaded_prediction:
+            fan = prediction.fan.reshape(-1, 2) if prediction.fan is not None else np.empty((0, 2))
+            points = np.concatenate([prediction.ephemeris.reshape(-1, 2), prediction.future, fan]).astype(np.float32)
+
+            if self.future_buffer is None or self.future_buffer.size < points.nbytes:
+                self.future_buffer = self.ctx.buffer(reserve=points.nbytes, usage="dynamic")
+                self.future_geometry = self.make_geometry(self.future_buffer)
+
+            self.future_buffer.write(points)
+            self.n_future_points = len(points) - len(fan)
+            self.n_fan_points = len(fan)
+            self.uploaded_prediction = prediction
+
+            # Trail bounds: each body of the ephemeris, the new body, each trajectory of the aim fan
+            trails = [column_bounds(prediction.ephemeris), column_bounds(prediction.future[:, None])]
+            if prediction.fan is not None:
+                trails.append(column_bounds(prediction.fan.transpose(1, 0, 2)))
+            self.future_lo = np.concatenate([lo for lo, hi in trails])
+            self.future_hi = np.concatenate([hi for lo, hi in trails])
+
+        if rect is not None:
+            visible = overlaps(self.future_lo, self.future_hi, rect)
+            self.culled_futures = int((~visible).sum())
+            if not visible.all():
+                self.draw_visible_futures(prediction, visible)
+                return
+
+        self.program["color"] = Color.to_float(Color.PREDICTION_COLOR)
+        self.future_geometry.render(self.program, vertices=self.n_future_points)
+
+        # Aim fan: the rest of the buffer, drawn faint
+        if self.n_fan_points:
+            self.program["color"] = Color.to_float(Color.AIM_FAN_COLOR, alpha=Color.AIM_FAN_ALPHA)
+            self.future_geometry.render(self.program, first=self.n_future_points, vertices=self.n_fan_points)
+
+    def draw_visible_futures(self, prediction: Prediction, visible: np.ndarray) -> None:
+        """Draw the trails of the prediction that are in view through an index buffer, in the layout of draw_futures."""
+        steps, n = prediction.ephemeris.shape[:2]
+        length = len(prediction.future)
+        ephemeris, future, fan = np.flatnonzero(visible[:n]), visible[n], np.flatnonzero(visible[n + 1:])
+
+        # Points of the visible trails, ephemeris and new body first, then the aim fan
+        n_main = steps * len(ephemeris) + length * future
+
+        def indices():
+            fan_start = steps * n + length
+            return np.concatenate([
+                (np.arange(steps)[:, None] * n + ephemeris[None, :]).ravel(),
+                steps * n + np.arange(length * future),
+                (fan_start + fan[:, None] * length + np.arange(length)[None, :]).ravel(),
+            ])
+
+        self.visible_futures.update(self.future_buffer, (prediction, visible.tobytes()), indices)
+
+        self.program["color"] = Color.to_float(Color.PREDICTION_COLOR)
+        self.visible_futures.render(self.program, vertices=n_main)
+
+        self.program["color"] = Color.to_float(Color.AIM_FAN_COLOR, alpha=Color.AIM_FAN_ALPHA)
+        self.visible_futures.render(self.program, first=n_main)